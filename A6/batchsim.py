@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from game_utils import Direction, Map, TileStatus
+from player_base import Player
+from simulator import Simulator
+from events import NullSink
+
+# offsets of the directions, indexed by Direction value
+_dx = np.array([ Direction(v).as_xy()[0] for v in range(len(Direction)) ], dtype=np.int64)
+_dy = np.array([ Direction(v).as_xy()[1] for v in range(len(Direction)) ], dtype=np.int64)
+
+_empty = TileStatus.Empty.value
+_mine = TileStatus.Mine.value
+
+
+def makeGame(map, seed, numPlayers, params=None):
+	"""
+	Simulator with numPlayers placeholder players and without any output,
+	to be played by Simulator.step; a game of a BatchSimulator starts in
+	exactly the same state
+
+	@param params GameParameters, None for the defaults
+	"""
+	sim = Simulator(map=map, seed=seed)
+	if params is not None:
+		sim.params = params
+	sim.events = NullSink()
+	for i in range(numPlayers):
+		sim.add_player(Player())
+	return sim
+
+
+class BatchSimulator(object):
+	"""
+	Many independent games on the same map, played in lock-step
+
+	The state of the games is kept in numpy arrays with the game as first
+	axis (tiles, positions, health and gold of the players, gold pots,
+	mines, free tiles), and every phase of a round is carried out for all
+	games at once. The rules are the ones of Simulator and MoveEngine, down
+	to the order of the random draws: every game has its own random.Random,
+	which draws the crash damage and the places of new gold pots like the
+	simulator's one, so a game goes exactly like a Simulator with the same
+	seed and the same actions (see conformance). Only games with one gold
+	pot (maxNumGoldPots = 1, the default) are supported.
+
+	There are no player objects; the actions of every round are passed to
+	step, and the state is read from the arrays directly:
+
+	x, y, health, gold -- int arrays (games, players)
+	potX, potY, potAmount, potRemaining -- int arrays (games,), the gold pot
+	and goldPotRemainingRounds
+	tiles -- TileStatus values (games, height*width), indexed by y*width + x
+	mineExpiry -- the round in which the mine at a tile expires, 0 for none
+
+	@param map the map of all games
+	@param seeds the seed of every game
+	@param numPlayers number of players in every game
+	@param params GameParameters, None for the defaults
+	"""
+	def __init__(self, map, seeds, numPlayers, params=None):
+		games = [ makeGame(map, seed, numPlayers, params) for seed in seeds ]
+		if not games:
+			raise ValueError("A batch needs at least one game.")
+		self.params = games[0].params
+		if self.params.maxNumGoldPots != 1:
+			raise ValueError("BatchSimulator supports exactly one gold pot per game.")
+		self.width, self.height = map.width, map.height
+		self.round = 0
+		self.numGames, self.numPlayers = len(games), numPlayers
+
+		self.tiles = np.stack([ sim.map._status.ravel() for sim in games ])
+		self.x = np.array([ [ s.x for s in sim._status ] for sim in games ], dtype=np.int64).reshape(len(games), -1)
+		self.y = np.array([ [ s.y for s in sim._status ] for sim in games ], dtype=np.int64).reshape(len(games), -1)
+		self.health = np.array([ [ s.health for s in sim._status ] for sim in games ],
+							dtype=np.int64).reshape(len(games), -1)
+		self.gold = np.array([ [ s.gold for s in sim._status ] for sim in games ],
+							dtype=np.int64).reshape(len(games), -1)
+		pots = [ next(iter(sim._goldPots.items())) for sim in games ]
+		self.potX = np.array([ x for (x, y), amount in pots ], dtype=np.int64)
+		self.potY = np.array([ y for (x, y), amount in pots ], dtype=np.int64)
+		self.potAmount = np.array([ amount for xy, amount in pots ], dtype=np.int64)
+		self.potRemaining = np.array([ sim.goldPotRemainingRounds for sim in games ], dtype=np.int64)
+		self.mineExpiry = np.zeros(self.tiles.shape, dtype=np.int64)
+		# when a mine was set, as the simulator's mines expire in that order
+		self._mineOrder = np.zeros(self.tiles.shape, dtype=np.int64)
+		self._minesSet = 0
+		self._tasks = np.zeros(self.x.shape, dtype=np.int64)
+		self.rngs = [ sim.rng for sim in games ]
+
+		# the free tiles of every game, like FreeCellPool (in the same order)
+		size = self.width*self.height
+		self._cells = np.zeros((len(games), size), dtype=np.int64)
+		self._index = np.full((len(games), size), -1, dtype=np.int64)
+		self._n = np.zeros(len(games), dtype=np.int64)
+		for g, sim in enumerate(games):
+			cells = sim._freeCells.getstate()
+			self._n[g] = len(cells)
+			self._cells[g, :len(cells)] = cells
+			self._index[g, cells] = np.arange(len(cells))
+
+	def _pool_add(self, g, c):
+		"""
+		Add tile c[i] to the free tiles of game g[i] (each game at most once)
+		"""
+		new = self._index[g, c] < 0
+		g, c = g[new], c[new]
+		self._index[g, c] = self._n[g]
+		self._cells[g, self._n[g]] = c
+		self._n[g] += 1
+
+	def _pool_discard(self, g, c):
+		i = self._index[g, c]
+		taken = i >= 0
+		g, c, i = g[taken], c[taken], i[taken]
+		self._n[g] -= 1
+		last = self._cells[g, self._n[g]]
+		self._cells[g, i] = last
+		self._index[g, last] = i
+		self._index[g, c] = -1
+
+	def _add_gold_pot(self, g):
+		"""
+		Place the gold pot of game g like Simulator._add_gold_pot: the one of
+		7 random free tiles farthest from the nearest player
+		"""
+		rng = self.rngs[g]
+		n = int(self._n[g])
+		if n == 0:
+			raise RuntimeError("No free tile left on the map.")
+		cells = self._cells[g, [ rng.randrange(n) for i in range(7) ]]
+		cy, cx = np.divmod(cells, self.width)
+		dist = np.maximum(np.abs(cx[:, None] - self.x[g]), np.abs(cy[:, None] - self.y[g])).min(axis=1)
+		c = cells[np.argmax(dist)]
+		self.potY[g], self.potX[g] = divmod(int(c), self.width)
+		self.potAmount[g] = self.params.initialGoldPotAmount
+		self._pool_discard(np.array([g]), np.array([c]))
+
+	def _pot_change(self):
+		"""
+		@returns per game how a paid task changes the gold pot
+		"""
+		p = self.params
+		return np.where(p.goldDecrease & (self.potRemaining <= p.goldDecreaseTime), -1, 1)
+
+	def _pay_for_tasks(self, pId, n, change):
+		"""
+		Pay for up to n[g] tasks of player pId in every game g, as
+		Simulator._pay_for_tasks
+
+		@returns the number of tasks paid per game
+		"""
+		t = self._tasks[:, pId]
+		gold = self.gold[:, pId]
+		# the i-th next task costs t + i (params.cost(t + k) - params.cost(t)
+		# for k tasks); the float root is corrected to the exact one
+		b = 2*t + 1
+		k = ((np.sqrt((b*b + 8*np.maximum(gold, 0)).astype(np.float64)) - b)//2).astype(np.int64)
+		cost = lambda k: k*t + k*(k + 1)//2
+		k = np.where(cost(k + 1) <= gold, k + 1, k)
+		k = np.where(cost(k) > gold, k - 1, k)
+		k = np.clip(k, 0, n)
+		self.gold[:, pId] -= cost(k)
+		self._tasks[:, pId] += k
+		self.potAmount += change*k
+		return k
+
+	def step(self, moves, mines=None):
+		"""
+		Play the next round of all games with the given actions, like
+		Simulator.step
+
+		@param moves int array (games, players, moves) of Direction values;
+		the moves of a player end at the first -1
+		@param mines int array (games, players, mines, 2) of the x and y
+		coordinates of the mines to set; the mines of a player end at the
+		first x = -1. None for no mines at all
+		@raises ValueError for invalid directions or coordinates (any
+		before the end of a player's list, e.g. x = -5)
+		"""
+		moves = np.asarray(moves, dtype=np.int64)
+		if moves.ndim != 3 or moves.shape[:2] != self.x.shape:
+			raise ValueError("moves must have the shape (games, players, moves)")
+		if np.any((moves < -1) | (moves >= len(Direction))):
+			raise ValueError("Invalid direction")
+		if mines is not None:
+			mines = np.asarray(mines, dtype=np.int64)
+			if mines.ndim != 4 or mines.shape[:2] != self.x.shape or mines.shape[3] != 2:
+				raise ValueError("mines must have the shape (games, players, mines, 2)")
+		self.round += 1
+		self._begin_round(self.round)
+		if mines is not None and mines.shape[2] > 0:
+			self._set_mines(mines, self.round)
+		self._move(moves)
+
+	def _begin_round(self, r):
+		# remove expired mines, in the order of the simulator
+		g, c = np.nonzero((self.mineExpiry > 0) & (self.mineExpiry <= r))
+		if len(g):
+			order = np.lexsort((self._mineOrder[g, c], self.mineExpiry[g, c], g))
+			g, c = g[order], c[order]
+			self.tiles[g, c] = _empty
+			self.mineExpiry[g, c] = 0
+			# the k-th expiring mine of every game
+			rank = np.arange(len(g)) - np.searchsorted(g, g)
+			for k in range(rank.max() + 1):
+				self._pool_add(g[rank == k], c[rank == k])
+
+		# relocate gold pots if timed out
+		self.potRemaining -= 1
+		timedOut = np.flatnonzero(self.potRemaining <= 0)
+		if len(timedOut):
+			self._pool_add(timedOut, self.potY[timedOut]*self.width + self.potX[timedOut])
+			for g in timedOut:
+				self._add_gold_pot(g)
+			self.potRemaining[timedOut] = self.params.goldPotTimeOut
+
+		self.gold += self.params.goldPerRound
+		self.health = np.minimum(self.params.maxHealth, self.health + self.params.healthPerRound)
+		self._tasks[:] = 0
+
+	def _set_mines(self, mines, r):
+		xs, ys = mines[..., 0], mines[..., 1]
+		given = np.cumprod(xs != -1, axis=2).astype(bool)
+		if np.any(given & ((xs < 0) | (xs >= self.width) | (ys < 0) | (ys >= self.height))):
+			raise ValueError("Mine coordinates not on the map")
+		cells = np.where(given, ys*self.width + xs, -1)
+		numMines = mines.shape[2]
+		earlier = np.tri(numMines, k=-1, dtype=bool)
+		change = self._pot_change()
+		for pId in range(self.numPlayers):
+			# every mine costs as many tasks as it is away from the player,
+			# the mines are paid in order and set if legal (see Simulator._set_mines)
+			d = np.maximum(np.abs(xs[:, pId] - self.x[:, pId, None]), np.abs(ys[:, pId] - self.y[:, pId, None]))
+			d = np.where(given[:, pId], d, 0)
+			paid = self._pay_for_tasks(pId, d.sum(axis=1), change)
+			n = ((np.cumsum(d, axis=1) <= paid[:, None]) & given[:, pId]).sum(axis=1)
+			c = cells[:, pId]
+			# only the first of several mines at a tile
+			first = ~((c[:, :, None] == c[:, None, :]) & earlier).any(axis=2)
+			for i in range(int(n.max(initial=0))):
+				g = np.flatnonzero((i < n) & first[:, i])
+				ci = c[g, i]
+				free = self._index[g, ci] >= 0
+				g, ci = g[free], ci[free]
+				self._minesSet += 1
+				self.tiles[g, ci] = _mine
+				self.mineExpiry[g, ci] = r + self.params.mineExpiryTime
+				self._mineOrder[g, ci] = self._minesSet
+				self._pool_discard(g, ci)
+
+	def _find_crashes(self, now, then):
+		"""
+		find_crashes for all games: players moving to the same tile or
+		swapping tiles crash and stay, until no further crashes arise
+
+		@param now, then flat positions (games, players) before and after
+		@returns bool array (games, players) of the crashed players
+		"""
+		other = ~np.eye(now.shape[1], dtype=bool)
+		moving = now != then
+		crashed = ((then[:, :, None] == then[:, None, :]) & other).any(axis=2)
+		crashed |= (moving[:, :, None] & moving[:, None, :] & (then[:, :, None] == now[:, None, :])
+					& (now[:, :, None] == then[:, None, :])).any(axis=2)
+		while True:
+			then = np.where(crashed, now, then)
+			more = crashed | ((then[:, :, None] == then[:, None, :]) & other).any(axis=2)
+			if np.array_equal(more, crashed):
+				return crashed
+			crashed = more
+
+	def _move(self, moves):
+		p = self.params
+		w, h = self.width, self.height
+		numMoves = np.cumprod(moves >= 0, axis=2).sum(axis=2)
+		cancelled = np.zeros(self.x.shape, dtype=bool)
+		for mId in range(moves.shape[2]):
+			has = mId < numMoves
+			if not has.any():
+				break
+			# every move has to be paid, even if it is not carried out
+			cost = 1 + self._tasks
+			paid = has & (self.gold >= cost)
+			self.gold -= np.where(paid, cost, 0)
+			self._tasks += paid
+			self.potAmount += self._pot_change()*paid.sum(axis=1)
+
+			pending = has & ~cancelled
+			cancelled |= pending & ~paid
+			done = pending & paid & (self.health >= p.minMoveHealth)
+			d = np.where(done, moves[:, :, mId], 0)
+			tx = np.where(done, self.x + _dx[d], self.x)
+			ty = np.where(done, self.y + _dy[d], self.y)
+
+			# crashes into walls, mines and the boundary
+			inside = (tx >= 0) & (tx < w) & (ty >= 0) & (ty < h)
+			target = np.where(inside, ty*w + tx, 0)
+			crashWall = done & (~inside | (np.take_along_axis(self.tiles, target, axis=1) != _empty))
+			done &= ~crashWall
+			cancelled |= crashWall
+			tx, ty = np.where(crashWall, self.x, tx), np.where(crashWall, self.y, ty)
+
+			# crashes between players
+			now = self.y*w + self.x
+			crashed = self._find_crashes(now, ty*w + tx)
+			crashPlayer = crashed & has
+			crashWall &= ~crashPlayer
+			done &= ~crashed
+			cancelled |= crashPlayer
+			tx, ty = np.where(crashed, self.x, tx), np.where(crashed, self.y, ty)
+
+			self.health = np.where(crashWall, np.maximum(0, self.health - p.healthPerWallCrash), self.health)
+			for g, pId in zip(*np.nonzero(crashPlayer)):
+				damage = p.healthPerPlayerCrash + self.rngs[g].randint(0, p.healthPerPlayerCrashRandom)
+				self.health[g, pId] = max(0, self.health[g, pId] - damage)
+
+			# update positions: first all movers leave, then they arrive,
+			# taking the gold pot
+			if not done.any():
+				continue
+			for pId in range(self.numPlayers):
+				g = np.flatnonzero(done[:, pId])
+				self._pool_add(g, now[g, pId])
+			taken = np.zeros(self.numGames, dtype=bool)
+			for pId in range(self.numPlayers):
+				g = np.flatnonzero(done[:, pId])
+				gx, gy = tx[g, pId], ty[g, pId]
+				gold = g[(gx == self.potX[g]) & (gy == self.potY[g])]
+				self.gold[gold, pId] += self.potAmount[gold]
+				taken[gold] = True
+				self._pool_discard(g, gy*w + gx)
+				self.x[g, pId], self.y[g, pId] = gx, gy
+			# a new pot, with a new timer
+			for g in np.flatnonzero(taken):
+				self.potRemaining[g] = p.goldPotTimeOut
+				self._add_gold_pot(g)
+
+	def state(self, g):
+		"""
+		The state of game g in the format of Simulator.snapshot
+		"""
+		w = self.width
+		objects = np.full(self.tiles.shape[1], -2, dtype=np.int32)
+		objects[self.y[g]*w + self.x[g]] = np.arange(self.numPlayers)
+		objects[self.potY[g]*w + self.potX[g]] = -1
+		mines = np.flatnonzero(self.mineExpiry[g])
+		return {
+			"round": self.round,
+			"status": self.tiles[g].reshape(self.height, w).copy(),
+			"objects": objects.reshape(self.height, w),
+			"players": [ (int(x), int(y), int(health), int(gold)) for x, y, health, gold
+						in zip(self.x[g], self.y[g], self.health[g], self.gold[g]) ],
+			"goldPots": { (int(self.potX[g]), int(self.potY[g])): int(self.potAmount[g]) },
+			"goldPotRemainingRounds": int(self.potRemaining[g]),
+			"mines": { (int(c % w), int(c // w)): int(self.mineExpiry[g, c]) for c in mines },
+			"rng": self.rngs[g].getstate(),
+			"freeCells": self._cells[g, :self._n[g]].copy(),
+		}
+
+
+def randomActions(batch, rng, maxMoves=3, maxMines=2, mineDistance=3):
+	"""
+	Random actions for all games of a batch (random numbers of random moves
+	and of mines close to the players)
+
+	@param rng a numpy random Generator
+	@returns moves and mines for BatchSimulator.step
+	"""
+	shape = (batch.numGames, batch.numPlayers)
+	moves = rng.integers(0, len(Direction), size=shape + (maxMoves,))
+	moves[np.arange(maxMoves) >= rng.integers(0, maxMoves + 1, size=shape)[..., None]] = -1
+	offsets = rng.integers(-mineDistance, mineDistance + 1, size=shape + (maxMines, 2))
+	mines = np.stack([ np.clip(batch.x[..., None] + offsets[..., 0], 0, batch.width - 1),
+					np.clip(batch.y[..., None] + offsets[..., 1], 0, batch.height - 1) ], axis=-1)
+	mines[np.arange(maxMines) >= rng.integers(0, maxMines + 1, size=shape)[..., None]] = -1
+	return moves, mines
+
+
+def simulatorActions(moves, mines, g):
+	"""
+	The actions of game g for Simulator.step
+
+	@param moves, mines arrays as for BatchSimulator.step
+	@returns the lists of moves and of mines of every player
+	"""
+	movesPerPlayer = []
+	for ms in moves[g].tolist():
+		ms = ms + [-1]
+		movesPerPlayer.append([ Direction(d) for d in ms[:ms.index(-1)] ])
+	minesPerPlayer = []
+	for ms in mines[g].tolist():
+		xs = [ x for x, y in ms ] + [-1]
+		minesPerPlayer.append([ (x, y) for x, y in ms[:xs.index(-1)] ])
+	return movesPerPlayer, minesPerPlayer
+
+
+def conformance(map, seeds, numPlayers, rounds, params=None, seed=0):
+	"""
+	Play the same random actions in a BatchSimulator and in Simulators with
+	the same seeds, and compare the states after every round
+
+	@returns list of (round, game, key of the state) which differ
+	"""
+	batch = BatchSimulator(map, seeds, numPlayers, params)
+	games = [ makeGame(map, s, numPlayers, params) for s in seeds ]
+	rng = np.random.default_rng(seed)
+	differences = []
+	for r in range(1, rounds + 1):
+		moves, mines = randomActions(batch, rng)
+		batch.step(moves, mines)
+		for g, sim in enumerate(games):
+			sim.step(*simulatorActions(moves, mines, g))
+			expected, got = sim.snapshot(), batch.state(g)
+			for key in expected:
+				if key in ("status", "objects", "freeCells"):
+					same = np.array_equal(expected[key], got[key])
+				else:
+					same = expected[key] == got[key]
+				if not same:
+					differences.append((r, g, key))
+	return differences
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Play many games at once with random actions, compared to"
+									" (or timed against) the simulator")
+	parser.add_argument('--map', help="map file (default: random map)", type=str, default=None)
+	parser.add_argument('--size', help="width = height of the random map", type=int, default=30)
+	parser.add_argument('--games', help="number of games", type=int, default=100)
+	parser.add_argument('--players', help="number of players per game", type=int, default=4)
+	parser.add_argument('--rounds', help="number of rounds", type=int, default=100)
+	parser.add_argument('--seed', help="seed of the first game (and of the map and the actions)", type=int,
+						default=0)
+	parser.add_argument('--conformance', help="compare every round of every game with the simulator",
+						action='store_true')
+	args = parser.parse_args()
+
+	if args.map is not None:
+		m = Map.read(args.map)
+	else:
+		m = Map.makeRandom(args.size, args.size, 0.3, seed=args.seed)
+	seeds = list(range(args.seed, args.seed + args.games))
+
+	if args.conformance:
+		differences = conformance(m, seeds, args.players, args.rounds, seed=args.seed)
+		for r, g, key in differences[:20]:
+			print("round %d, game %d (seed %d): %s differs" % (r, g, seeds[g], key))
+		print("%d games x %d rounds: %s" % (args.games, args.rounds,
+			"%d differences" % len(differences) if differences else "same as the simulator"))
+		sys.exit(1 if differences else 0)
+
+	# the actions are made every round, close to the current positions, but
+	# only the steps are timed
+	batch = BatchSimulator(m, seeds, args.players)
+	rng = np.random.default_rng(args.seed)
+	seconds = 0.0
+	for r in range(args.rounds):
+		moves, mines = randomActions(batch, rng)
+		startTime = time.perf_counter()
+		batch.step(moves, mines)
+		seconds += time.perf_counter() - startTime
+	print("batch:     %10.0f game rounds/s" % (args.games*args.rounds/seconds))
+
+	# a batch of the same single game makes its actions
+	sim = makeGame(m, args.seed, args.players)
+	game = BatchSimulator(m, seeds[:1], args.players)
+	rng = np.random.default_rng(args.seed)
+	seconds = 0.0
+	for r in range(args.rounds):
+		moves, mines = randomActions(game, rng)
+		game.step(moves, mines)
+		actions = simulatorActions(moves, mines, 0)
+		startTime = time.perf_counter()
+		sim.step(*actions)
+		seconds += time.perf_counter() - startTime
+	print("simulator: %10.0f game rounds/s" % (args.rounds/seconds))
+
+
+if __name__ == "__main__":
+	main()
@@ -37,10 +37,14 @@ class MyPathFindingPlayer(Player):
                 ourMap = self.ourMap
                 #print("Our Map, before")
                 #print(ourMap)
-                for x in range(ourMap.width):
-                        for y in range(ourMap.height):
-                                if status.map[x, y].status != TileStatus.Unknown:
-                                        ourMap[x, y].status = status.map[x, y].status
+                if status.delta is not None:
+                        # only the tiles which changed since the last round
+                        ourMap.applyDelta(status.delta)
+                else:
+                        for x in range(ourMap.width):
+                                for y in range(ourMap.height):
+                                        if status.map[x, y].status != TileStatus.Unknown:
+                                                ourMap[x, y].status = status.map[x, y].status
                 #print("Our Map, after")
                 #print(ourMap)
 
@@ -50,17 +54,17 @@ class MyPathFindingPlayer(Player):
                 gLoc = next(iter(status.goldPots))
 
                 ## determine next move d based on shortest path finding
-                paths = AllShortestPaths(gLoc,ourMap)
+                paths = AllShortestPaths(gLoc,ourMap,directions=not self.random)
 
                 if self.random:
                         bestpath = paths.randomShortestPathFrom(curpos)
+                        bestpath = bestpath[1:]
+                        bestpath.append( gLoc )
+                        directions = self._as_directions(curpos,bestpath)
                 else:
-                        bestpath = paths.shortestPathFrom(curpos)
-
-                bestpath = bestpath[1:]
-                bestpath.append( gLoc )
+                        directions = paths.directionsFrom(curpos)
 
-                distance=len(bestpath)
+                distance=len(directions)
 
                 numMoves = 1
 
@@ -69,6 +73,6 @@ class MyPathFindingPlayer(Player):
                         numMoves = 0
                         # print("SillyScout: I rather wait")
 
-                return self._as_directions(curpos,bestpath[:numMoves])
+                return directions[:numMoves]
 
 players = [ MyPathFindingPlayer()]
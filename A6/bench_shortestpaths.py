@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import argparse
+from collections import deque
+import glob
+import random
+import time
+
+import numpy as np
+
+from game_utils import Map, TileStatus
+from shortestpaths import AllShortestPaths
+from pathplanning import PathPlanner
+
+parser = argparse.ArgumentParser(description="Benchmark the distance calculation of AllShortestPaths"
+                                 " and the single path search of PathPlanner")
+parser.add_argument('maps', help="map files (default: Maps/*.dat)", type=str, nargs='*')
+parser.add_argument('--size', help="size of the additional random maps", type=int, default=500)
+parser.add_argument('--density', help="density of the additional random maps", type=float, nargs='+',
+                    default=[0.1, 0.3])
+parser.add_argument('--sinks', help="number of random sinks per map", type=int, default=10)
+parser.add_argument('--seed', help="seed for the random maps and sinks", type=int, default=0)
+
+
+def referenceDistances(wallmap, sink):
+    """
+    Distances by the original breadth first search with a deque (indexed [x,y])
+    """
+    width, height = wallmap.shape
+    dist = np.negative(np.ones((width, height), dtype='int'))
+    dist[sink] = 0
+    front = deque([sink])
+    while front:
+        x, y = front.popleft()
+        for nx in (x-1, x, x+1):
+            for ny in (y-1, y, y+1):
+                if 0 <= nx < width and 0 <= ny < height and not wallmap[nx,ny] and dist[nx,ny] < 0:
+                    dist[nx,ny] = dist[x,y] + 1
+                    front.append((nx,ny))
+    return dist
+
+
+def randomMap(size, density, rng):
+    """
+    Random map; unlike Map.makeRandom, it need not be connected
+    (which large random maps hardly ever are)
+    """
+    m = Map(size, size)
+    walls = rng.random((size, size)) < density
+    m._status[:] = np.where(walls, TileStatus.Wall.value, TileStatus.Empty.value)
+    return m
+
+
+def bench(name, m, sinks):
+    wallmap = m.statusMask(TileStatus.Wall).T
+    tref = tnew = 0.0
+    for sink in sinks:
+        start = time.perf_counter()
+        ref = referenceDistances(wallmap, sink)
+        tref += time.perf_counter() - start
+
+        start = time.perf_counter()
+        paths = AllShortestPaths(sink, m)
+        tnew += time.perf_counter() - start
+
+        assert np.array_equal(ref, paths.dist), "different distances on %s from %s" % (name, sink)
+    print("{:<40}{:>10}{:>12.2f}{:>12.2f}{:>9.1f}x".format(
+        name, "%dx%d" % (m.width, m.height),
+        1000*tref/len(sinks), 1000*tnew/len(sinks), tref/tnew))
+
+
+def benchPlanner(name, m, pairs):
+    """
+    Single paths: flooding the whole map vs. A* and jump point search
+    """
+    planner = PathPlanner(m)
+    free = int((~m.statusMask(TileStatus.Wall)).sum())
+    times = { "flood": 0.0, "astar": 0.0, "jps": 0.0 }
+    expansions = { "flood": free*len(pairs), "astar": 0, "jps": 0 }
+    for start, goal in pairs:
+        t = time.perf_counter()
+        ref = AllShortestPaths(goal, m, cache=None).shortestPathFrom(start)
+        times["flood"] += time.perf_counter() - t
+        for method in ("astar", "jps"):
+            t = time.perf_counter()
+            path = planner.shortestPath(start, goal, method)
+            times[method] += time.perf_counter() - t
+            expansions[method] += planner.expansions
+            assert len(path) == len(ref), "%s: different path length on %s" % (method, name)
+    print("{:<40}{:>10}".format(name, "%dx%d" % (m.width, m.height)) + "".join(
+        "{:>10.2f}{:>10d}".format(1000*times[k]/len(pairs), expansions[k]//len(pairs))
+        for k in ("flood", "astar", "jps")))
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    maps = [ (f, Map.read(f)) for f in (args.maps or sorted(glob.glob("Maps/*.dat"))) ]
+    for density in args.density:
+        maps.append( ("random %.2f" % density, randomMap(args.size, density, np.random.default_rng(args.seed))) )
+
+    print("{:<40}{:>10}{:>12}{:>12}{:>10}".format("map", "size", "deque [ms]", "numpy [ms]", "speedup"))
+    for name, m in maps:
+        ys, xs = np.nonzero(~m.statusMask(TileStatus.Wall))
+        free = list(zip(xs.tolist(), ys.tolist()))
+        bench(name, m, rng.sample(free, min(args.sinks, len(free))))
+
+    print()
+    print("{:<40}{:>10}{:>20}{:>20}{:>20}".format("map", "size", "flood [ms/nodes]", "A* [ms/nodes]",
+                                                  "JPS [ms/nodes]"))
+    for name, m in maps:
+        ys, xs = np.nonzero(~m.statusMask(TileStatus.Wall))
+        free = list(zip(xs.tolist(), ys.tolist()))
+        pairs = [ tuple(rng.sample(free, 2)) for i in range(args.sinks) ]
+        benchPlanner(name, m, pairs)
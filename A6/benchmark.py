@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from game_utils import Direction, Map, TileStatus
+from player_base import Player
+from player_host import PlayerHost
+from shortestpaths import AllShortestPaths
+from simulator import Simulator
+from events import NullSink
+
+parser = argparse.ArgumentParser(description="Benchmark the hot paths of the simulator and the path finding")
+parser.add_argument('--sizes', help="sizes (width = height) of the maps", type=int, nargs='+', default=[30, 100])
+parser.add_argument('--players', help="numbers of players", type=int, nargs='+', default=[2, 10])
+parser.add_argument('--rounds', help="number of rounds of the full games", type=int, default=50)
+parser.add_argument('--repeat', help="number of timed runs per benchmark", type=int, default=7)
+parser.add_argument('--only', help="run only the benchmarks whose name contains one of these", type=str,
+					nargs='+', default=None)
+parser.add_argument('--output', help="write the results as JSON to this file", type=str, default=None)
+parser.add_argument('--baseline', help="compare with the results in this JSON file", type=str, default=None)
+parser.add_argument('--threshold', help="relative change of the median reported as faster/slower",
+					type=float, default=0.1)
+
+
+class StubPlayer(Player):
+	"""
+	Cheap player moving randomly by one field, reproducible by its seed
+	"""
+	def __init__(self, seed):
+		self.rng = random.Random(seed)
+
+	def reset(self, player_id, max_players, width, height):
+		self.player_name = "Stub%d" % player_id
+
+	def round_begin(self, r):
+		pass
+
+	def set_mines(self, status):
+		return []
+
+	def move(self, status):
+		return [ self.rng.choice(list(Direction)) ]
+
+
+def makeSimulator(size, players, seed=0):
+	"""
+	Simulator with stub players hosted in-process, without any output
+	"""
+	sim = Simulator(map=Map.makeRandom(size, size, 0.3, seed=seed), seed=seed)
+	sim.events = NullSink()
+	sim.usePlayerProcesses = False
+	for i in range(players):
+		sim.add_player(StubPlayer(seed + i))
+	return sim
+
+
+def startSimulator(sim, rounds):
+	"""
+	Prepare the players as Simulator.play does, for timing single phases;
+	stopSimulator cleans up afterwards
+	"""
+	sim._hosts = [ PlayerHost(p) for p in sim._players ]
+	for pId, host in enumerate(sim._hosts):
+		sim._pubStat[pId].params.rounds = rounds
+		host.start()
+		host.call("reset", pId, len(sim._players), sim.map.width, sim.map.height, status=sim._pubStat[pId])
+	return sim
+
+
+def stopSimulator(sim):
+	"""
+	Clean up after startSimulator, as Simulator.play does at the end
+	"""
+	for host in sim._hosts:
+		host.stop()
+	sim._close_loop()
+
+
+def measure(run, repeat, setup=None):
+	"""
+	Wall time of run() in seconds, repeat times; setup() is called before
+	every run and not timed, its result is passed to run
+	"""
+	times = []
+	for i in range(repeat):
+		arg = setup() if setup is not None else None
+		start = time.perf_counter()
+		run(arg)
+		times.append(time.perf_counter() - start)
+	return times
+
+
+def benchmarks(args, tmpdir):
+	"""
+	Yield (name, parameters, run, setup) of all benchmarks
+	"""
+	for size in args.sizes:
+		p = { "size": size }
+		yield "makeRandom", p, lambda arg, size=size: Map.makeRandom(size, size, 0.3, seed=1), None
+
+		m = Map.makeRandom(size, size, 0.3, seed=1)
+		for fmt in ("text", "bytes"):
+			filename = os.path.join(tmpdir, "map%d.%s" % (size, fmt))
+			m.write(filename, fmt)
+			yield "read_" + fmt, p, lambda arg, filename=filename: Map.read(filename)._status.sum(), None
+
+		xs, ys = np.nonzero(~m.statusMask(TileStatus.Wall).T)
+		sink = (int(xs[0]), int(ys[0]))
+		yield "shortestpaths_init", p, lambda arg, m=m, sink=sink: AllShortestPaths(sink, m, cache=None), None
+		yield "shortestpaths_init_directions", p, \
+			lambda arg, m=m, sink=sink: AllShortestPaths(sink, m, cache=None, directions=True), None
+		# paths from the field farthest from the sink
+		paths = AllShortestPaths(sink, m, cache=None, directions=True)
+		start = np.unravel_index(np.argmax(paths.dist), paths.dist.shape)
+		start = (int(start[0]), int(start[1]))
+		yield "shortestpaths_path", p, lambda arg, start=start: paths.shortestPathFrom(start), None
+		yield "shortestpaths_directions", p, lambda arg, start=start: paths.directionsFrom(start), None
+
+		for players in args.players:
+			p = { "size": size, "players": players }
+			sim = startSimulator(makeSimulator(size, players), args.rounds)
+
+			def copyToPublic(arg, sim=sim):
+				for s, pub in zip(sim._status, sim._pubStat):
+					sim._copy_to_public(s, pub)
+			yield "copy_to_public", p, copyToPublic, None
+
+			def nextRound(sim=sim):
+				sim.round += 1
+				sim._begin_round(sim.round)
+				return sim.round
+			yield "handle_moving", p, lambda r, sim=sim: sim._handle_moving(r), nextRound
+
+			def play(sim, rounds=args.rounds):
+				sim.play(rounds=rounds)
+			yield "play", dict(p, rounds=args.rounds), play, \
+				lambda size=size, players=players: makeSimulator(size, players)
+			# done with sim: stop the threads in which it asked the players
+			stopSimulator(sim)
+
+
+def key(name, parameters):
+	return "%s[%s]" % (name, ",".join("%s=%s" % kv for kv in sorted(parameters.items())))
+
+
+def compare(results, baseline, threshold):
+	s = "{:<50}{:>14}{:>14}{:>9}\n".format("benchmark", "baseline [ms]", "now [ms]", "ratio")
+	for k, result in results.items():
+		if k not in baseline:
+			continue
+		old, new = baseline[k]["median"], result["median"]
+		ratio = new / old if old > 0 else float("inf")
+		verdict = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else ""
+		s += "{:<50}{:>14.3f}{:>14.3f}{:>9.2f}  {}\n".format(k, 1000*old, 1000*new, ratio, verdict)
+	return s
+
+
+if __name__ == "__main__":
+	args = parser.parse_args()
+
+	results = {}
+	print("{:<50}{:>12}{:>12}".format("benchmark", "median [ms]", "min [ms]"))
+	with tempfile.TemporaryDirectory() as tmpdir:
+		for name, parameters, run, setup in benchmarks(args, tmpdir):
+			if args.only is not None and not any(o in name for o in args.only):
+				continue
+			# players print to stdout
+			with open(os.devnull, "w") as devnull:
+				stdout, sys.stdout = sys.stdout, devnull
+				try:
+					times = measure(run, args.repeat, setup)
+				finally:
+					sys.stdout = stdout
+			k = key(name, parameters)
+			results[k] = { "name": name, "parameters": parameters, "median": statistics.median(times),
+							"min": min(times), "times": times }
+			print("{:<50}{:>12.3f}{:>12.3f}".format(k, 1000*results[k]["median"], 1000*results[k]["min"]))
+
+	if args.output is not None:
+		with open(args.output, "w") as fh:
+			json.dump({
+				"date": datetime.datetime.now().isoformat(timespec="seconds"),
+				"python": platform.python_version(),
+				"numpy": np.__version__,
+				"machine": platform.machine(),
+				"repeat": args.repeat,
+				"results": results,
+			}, fh, indent=1)
+
+	if args.baseline is not None:
+		with open(args.baseline) as fh:
+			baseline = json.load(fh)["results"]
+		print()
+		print(compare(results, baseline, args.threshold))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from game_utils import Map, TileStatus, _mapMagic
+
+parser = argparse.ArgumentParser(description="Convert maps between the text and the binary formats")
+parser.add_argument('maps', help="map files (e.g. Maps/*.dat)", type=str, nargs='*')
+parser.add_argument('--format', help="format of the converted maps", type=str, default="bytes",
+					choices=["text", "bytes", "bits"])
+parser.add_argument('--suffix', help="suffix of the converted maps (default: .dat for text, .map otherwise)",
+					type=str, default=None)
+parser.add_argument('--check', help="instead of converting, check the round trips between all formats on"
+					" the maps and on generated maps of odd sizes", action='store_true')
+
+
+def sameMap(a, b):
+	return (a.width, a.height) == (b.width, b.height) and np.array_equal(a._status, b._status)
+
+
+def roundTrip(m, formats, tmpdir):
+	"""
+	Write the map in each of the formats in turn, reading it back each time
+
+	@returns the format after which the map differs, None if it never does
+	"""
+	current = m
+	for i, format in enumerate(formats):
+		filename = os.path.join(tmpdir, "roundtrip%d" % i)
+		current.write(filename, format)
+		current = Map.read(filename)
+		if not sameMap(current, m):
+			return format
+	return None
+
+
+def check(mapfiles, tmpdir):
+	"""
+	Check the round trips text <-> bytes <-> bits on the given maps and on
+	random maps of sizes whose tiles don't fill the last byte of the bits
+	format, and that the padding bits of that byte are ignored
+
+	@returns list of the failures, as messages
+	"""
+	rng = np.random.default_rng(0)
+	wall = TileStatus.Wall.value
+	cases = [ (mapfile, Map.read(mapfile)) for mapfile in mapfiles ]
+	for width in (1, 2, 3, 5, 7, 8, 9, 13, 17, 31):
+		for height in (1, 3, 8, 11):
+			for density in (0.0, 0.4, 1.0):
+				m = Map.makeEmpty(width, height)
+				m._status[rng.random((height, width)) < density] = wall
+				cases.append(("%dx%d, wall density %g" % (width, height, density), m))
+
+	failures = []
+	orders = [ ["text", "bytes", "bits", "text"], ["bits", "text", "bytes"], ["bytes", "bits", "bytes"] ]
+	for name, m in cases:
+		for formats in orders:
+			failed = roundTrip(m, formats, tmpdir)
+			if failed is not None:
+				failures.append("%s: differs after %s in %s" % (name, failed, " -> ".join(formats)))
+
+		# the tiles fill the bits from the most significant one; the rest of
+		# the last byte is padding, which read must ignore
+		filename = os.path.join(tmpdir, "bits")
+		m.write(filename, "bits")
+		size = len(_mapMagic) + 16 + (m.width*m.height + 7)//8
+		if os.path.getsize(filename) != size:
+			failures.append("%s: the bits file has %d bytes instead of %d" % (name, os.path.getsize(filename), size))
+		unused = 8*((m.width*m.height + 7)//8) - m.width*m.height
+		if unused > 0:
+			with open(filename, "r+b") as fh:
+				fh.seek(-1, os.SEEK_END)
+				last = fh.read(1)[0]
+				fh.seek(-1, os.SEEK_END)
+				fh.write(bytes([last | ((1 << unused) - 1)]))
+			if not sameMap(Map.read(filename), m):
+				failures.append("%s: the padding bits of the bits format are not ignored" % name)
+
+	# all tile states (only the bytes format can hold mines)
+	m = Map.makeEmpty(9, 5)
+	m._status[:] = rng.integers(0, len(TileStatus), size=(5, 9))
+	if roundTrip(m, ["bytes", "bytes"], tmpdir) is not None:
+		failures.append("mines and unknown tiles: differ after bytes")
+	return failures
+
+
+if __name__ == "__main__":
+	args = parser.parse_args()
+	if args.check:
+		with tempfile.TemporaryDirectory() as tmpdir:
+			failures = check(args.maps, tmpdir)
+		for failure in failures:
+			print(failure)
+		print("round trips: %s" % ("%d failures" % len(failures) if failures else "ok"))
+		sys.exit(1 if failures else 0)
+
+	if not args.maps:
+		parser.error("no map files given")
+	suffix = args.suffix
+	if suffix is None:
+		suffix = ".dat" if args.format == "text" else ".map"
+
+	for mapfile in args.maps:
+		m = Map.read(mapfile)
+		output = os.path.splitext(mapfile)[0] + suffix
+		if output == mapfile:
+			raise SystemExit("%s: won't overwrite the input, use --suffix." % mapfile)
+		m.write(output, args.format)
+
+		# check the round trip
+		start = time.perf_counter()
+		converted = Map.read(output)
+		seconds = time.perf_counter() - start
+		if ((converted.width, converted.height) != (m.width, m.height)
+				or not np.array_equal(converted._status, m._status)):
+			raise SystemExit("%s: the converted map %s differs." % (mapfile, output))
+		print("%s -> %s (%d bytes, read in %.1fms)" % (mapfile, output, os.path.getsize(output), 1000*seconds))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from game_utils import Map, TileStatus
+from shortestpaths import wavefrontDistances
+
+# default directory of the cached tables
+defaultCacheDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Maps", ".distances")
+
+# neighbor offsets (dx,dy) in the order of AllShortestPaths.nonWallNeighborsIter
+_stepOffsets = [(0,-1), (0,1), (-1,0), (-1,-1), (-1,1), (1,0), (1,-1), (1,1)]
+
+# distance of unreachable pairs in the table
+_unreachable = np.iinfo(np.uint16).max
+
+
+def mapHash(map):
+    """
+    Content hash of the walls of a map (hex string)
+    """
+    h = hashlib.sha1()
+    h.update(np.array([map.width, map.height], dtype='<u4').tobytes())
+    h.update(np.packbits(map.statusMask(TileStatus.Wall)).tobytes())
+    return h.hexdigest()
+
+
+class DistanceTable:
+    """
+    Shortest path distances between all pairs of non-wall fields of a map
+
+    The table is calculated once per map and stored in cachedir as
+    <hash of the map>.npy; later it is memory mapped read-only, so loading
+    is instant and all processes using the same map share its pages.
+    The table holds len(free fields)^2 16 bit distances, i.e. it is meant
+    for the maps of the game (about 12MB for 49x49), not for huge maps.
+
+    @param map the map; only walls are obstacles
+    @param cachedir directory of the cached tables; None to not cache
+    """
+    def __init__(self, map, cachedir=defaultCacheDir):
+        self.width = map.width
+        self.height = map.height
+        self.hash = mapHash(map)
+
+        # indexed [x,y]
+        self.wallmap = map.statusMask(TileStatus.Wall).T
+        # index of every non-wall field in the table, -1 for walls
+        xs, ys = np.nonzero(~self.wallmap)
+        self._index = np.full(self.wallmap.shape, -1, dtype=np.int32)
+        self._index[xs, ys] = np.arange(len(xs))
+        self._fields = (xs, ys)
+
+        filename = None if cachedir is None else os.path.join(cachedir, self.hash + ".npy")
+        if filename is not None and os.path.exists(filename):
+            self.table = np.load(filename, mmap_mode='r')
+        else:
+            self.table = self._calcTable()
+            if filename is not None:
+                self._save(cachedir, filename)
+
+    def _calcTable(self):
+        xs, ys = self._fields
+        table = np.empty((len(xs), len(xs)), dtype=np.uint16)
+        for i, sink in enumerate(zip(xs.tolist(), ys.tolist())):
+            dist = wavefrontDistances(self.wallmap, sink)[xs, ys]
+            table[i] = np.where(dist < 0, _unreachable, dist)
+        table.flags.writeable = False
+        return table
+
+    def _save(self, cachedir, filename):
+        # write to a temporary file first; other processes may read the table
+        os.makedirs(cachedir, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=cachedir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                np.save(fh, self.table)
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.remove(tmpname)
+            raise
+
+    def _row(self, xy):
+        # numpy would wrap negative coordinates around
+        if not (0 <= xy[0] < self.width and 0 <= xy[1] < self.height):
+            raise ValueError("(%d, %d) is not on the map." % tuple(xy))
+        i = self._index[tuple(xy)]
+        if i < 0:
+            raise ValueError("(%d, %d) is a wall." % tuple(xy))
+        return i
+
+    def distance(self, a, b):
+        """
+        @returns the number of moves from a to b, -1 if b can't be reached
+        """
+        d = int(self.table[self._row(a), self._row(b)])
+        return -1 if d == _unreachable else d
+
+    def nextStep(self, a, b):
+        """
+        @returns the first field after a on a shortest path from a to b;
+        None if a == b or b can't be reached
+        """
+        d = self.distance(a, b)
+        if d <= 0:
+            return None
+        row = self.table[self._row(b)]
+        for dx, dy in _stepOffsets:
+            x, y = a[0] + dx, a[1] + dy
+            if 0 <= x < self.width and 0 <= y < self.height:
+                i = self._index[x, y]
+                if i >= 0 and row[i] == d - 1:
+                    return (x, y)
+        assert False, "no next step from %s to %s" % (a, b)
+
+    def distancesTo(self, b):
+        """
+        @returns array indexed [x,y] with the distances of all fields to b
+        (as AllShortestPaths.dist; -1 for walls and unreachable fields)
+        """
+        dist = np.full(self.wallmap.shape, -1, dtype='int')
+        row = self.table[self._row(b)].astype('int')
+        row[row == _unreachable] = -1
+        dist[self._fields] = row
+        return dist
+
+
+def check(map, pairs=200, seed=0):
+    """
+    Check a table of the map (not cached) against the wavefront distances,
+    its next steps, and that coordinates off the map or on walls (as tuples
+    and as lists) raise ValueError
+
+    @returns list of the failures, as messages
+    """
+    table = DistanceTable(map, cachedir=None)
+    rng = np.random.default_rng(seed)
+    xs, ys = table._fields
+    failures = []
+    for i in rng.integers(0, len(xs), size=(pairs, 2)):
+        a, b = (int(xs[i[0]]), int(ys[i[0]])), (int(xs[i[1]]), int(ys[i[1]]))
+        expected = int(wavefrontDistances(table.wallmap, b)[a])
+        d = table.distance(a, b)
+        if d != expected:
+            failures.append("distance %s -> %s is %d instead of %d" % (a, b, d, expected))
+        step = table.nextStep(a, b)
+        if d > 0 and table.distance(step, b) != d - 1:
+            failures.append("next step %s from %s to %s is no shortest path" % (step, a, b))
+
+    field = (int(xs[0]), int(ys[0]))
+    bad = [ (-1, 0), (0, -1), (map.width, 0), (0, map.height) ]
+    wx, wy = np.nonzero(table.wallmap)
+    bad += [ (int(x), int(y)) for x, y in zip(wx[:1], wy[:1]) ]
+    for xy in bad + [ list(xy) for xy in bad ]:
+        for a, b in ((xy, field), (field, xy)):
+            try:
+                table.distance(a, b)
+                failures.append("distance %s -> %s doesn't raise ValueError" % (a, b))
+            except ValueError:
+                pass
+            except Exception as e:
+                failures.append("distance %s -> %s raises %s" % (a, b, repr(e)))
+    if table.distance(list(field), list(field)) != 0:
+        failures.append("list coordinates are not accepted")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the distance tables of maps")
+    parser.add_argument('maps', help="map files (e.g. Maps/*.dat)", type=str, nargs='*')
+    parser.add_argument('--cachedir', help="directory of the tables", type=str, default=defaultCacheDir)
+    parser.add_argument('--check', help="instead of precomputing, check the tables of the maps (and of a random"
+                        " map) against the path finding and the coordinate checks", action='store_true')
+    args = parser.parse_args()
+
+    if args.check:
+        failures = []
+        for name, m in [ (mapfile, Map.read(mapfile)) for mapfile in args.maps ] \
+                + [ ("random 23x17", Map.makeRandom(23, 17, 0.3, seed=1)) ]:
+            failures += [ "%s: %s" % (name, failure) for failure in check(m) ]
+        for failure in failures:
+            print(failure)
+        print("distance tables: %s" % ("%d failures" % len(failures) if failures else "ok"))
+        raise SystemExit(1 if failures else 0)
+    if not args.maps:
+        parser.error("no map files given")
+
+    for mapfile in args.maps:
+        table = DistanceTable(Map.read(mapfile), args.cachedir)
+        print("%s: %d fields, %s" % (mapfile, len(table.table),
+            os.path.join(args.cachedir, table.hash + ".npy")))
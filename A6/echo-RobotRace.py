@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+from external_player import ExternalPlayer
+
+# the example bot echobot.py as an external program
+players = [ ExternalPlayer([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "echobot.py")],
+	name="Echo") ]
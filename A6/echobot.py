@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Example of an external bot for ExternalPlayer (see external_player.py),
+using nothing but the standard library, as a bot in another language
+would: it answers every request over stdin/stdout and walks one field
+per round towards the nearest gold pot it knows of.
+"""
+import json
+import struct
+import sys
+
+header = struct.Struct(">I")
+steps = { (0, 1): "up", (0, -1): "down", (-1, 0): "left", (1, 0): "right",
+	(-1, 1): "up_left", (1, 1): "up_right", (-1, -1): "down_left", (1, -1): "down_right" }
+
+
+def read(stream):
+	data = stream.read(header.size)
+	if len(data) < header.size:
+		return None
+	size, = header.unpack(data)
+	return json.loads(stream.read(size))
+
+
+def write(stream, message):
+	payload = json.dumps(message).encode()
+	stream.write(header.pack(len(payload)) + payload)
+	stream.flush()
+
+
+def tile(m, x, y):
+	x, y = x - m["x0"], y - m["y0"]
+	if 0 <= y < len(m["rows"]) and 0 <= x < len(m["rows"][y]):
+		return m["rows"][y][x]
+	return "_"
+
+
+def move(status):
+	if not status["goldPots"]:
+		return []
+	x, y = status["x"], status["y"]
+	gx, gy, amount = min(status["goldPots"], key=lambda p: max(abs(p[0] - x), abs(p[1] - y)))
+	dx, dy = (gx > x) - (gx < x), (gy > y) - (gy < y)
+	# try the direct step first, then the ones next to it
+	for sx, sy in ((dx, dy), (dx, 0), (0, dy)):
+		if (sx, sy) != (0, 0) and tile(status["map"], x + sx, y + sy) == ".":
+			return [steps[sx, sy]]
+	return []
+
+
+if __name__ == "__main__":
+	stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+	while True:
+		request = read(stdin)
+		if request is None:
+			break
+		command = request["command"]
+		if command == "reset":
+			answer = { "name": "Echo" }
+		elif command == "set_mines":
+			answer = { "mines": [] }
+		elif command == "move":
+			answer = { "moves": move(request["status"]) }
+		else:
+			answer = {}
+		write(stdout, answer)
@@ -0,0 +1,172 @@
+import json
+import sys
+import threading
+
+# log levels of events
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+SILENT = 100
+
+levelNames = { DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error", SILENT: "silent" }
+
+
+# how events are written as text (in the traditional format of the simulator)
+_textFormats = {
+	"board":          "{separator}{title}\n{board}",
+	"mine_set":       "Player {player} sets mine at ({x}, {y}) (distance {distance}; expires in round {expires}).",
+	"mine_expired":   "Remove expired mine at ({x}, {y}).",
+	"pot_relocated":  "Gold pot at ({x:>3}, {y:>3}) with {amount} coints emtpied and relocated\n",
+	"pot_taken":      "Event: {name} took a pot of {amount} gold.",
+	"ask_moves":      "Ask players for moves...",
+	"player_moves":   "Player {player} returns moves after {seconds:3.1f}s: {moves}",
+	"player_timeout": "ERROR: player {player} didn't answer in time.",
+	"player_error":   "ERROR: player {player} raised an exception: {message}\n{traceback}",
+	"player_disabled": "ERROR: player {player} is disabled, because {message}",
+	"too_weak":       "Player {player} is too weak to move",
+	"moved":          "Event: {name} moved {direction}",
+	"crash_wall":     "Event: {name} crashed into a wall while trying to move {direction}.",
+	"crash_player":   "Event: {name} crashed into another player while trying to move {direction}.",
+	"out_of_gold":    "Event: {name} could not move {direction}. No enough gold.",
+	"out_of_health":  "Event: {name} could not move {direction}. No health.",
+	"cancelled":      "Event: {name} could not move {direction} due to a previous event this round.",
+	"debug":          "Debug: {message}",
+	"bug":            "Bug: {message}",
+}
+
+
+class Event(object):
+	"""
+	Something that happened in the game
+
+	@param kind the type of the event, e.g. "crash_wall" (see _textFormats)
+	@param level the log level
+	@param round the round of the game (0 before the first round)
+	@param data the details of the event; must be serializable as JSON
+	"""
+	__slots__ = ("kind", "level", "round", "data")
+
+	def __init__(self, kind, level=INFO, round=0, **data):
+		self.kind = kind
+		self.level = level
+		self.round = round
+		self.data = data
+
+	def as_dict(self):
+		d = { "kind": self.kind, "level": levelNames.get(self.level, self.level), "round": self.round }
+		d.update(self.data)
+		return d
+
+	def __str__(self):
+		text = _textFormats[self.kind].format(**self.data)
+		if self.kind == "player_error":
+			text = text.rstrip("\n")
+		return text
+
+
+class EventSink(object):
+	"""
+	Base class of the destinations of events
+
+	Events below the level of the sink are dropped; callers check enabled()
+	before building expensive events (like the board).
+	"""
+	def __init__(self, level=INFO):
+		self.level = level
+
+	def enabled(self, level):
+		return level >= self.level
+
+	def emit(self, event):
+		raise NotImplementedError("'emit' not implemented in '%s'." % self.__class__)
+
+	def flush(self):
+		pass
+
+	def close(self):
+		self.flush()
+
+
+class NullSink(EventSink):
+	"""
+	Drop all events; nothing is ever formatted
+	"""
+	def __init__(self):
+		super().__init__(SILENT)
+
+	def emit(self, event):
+		pass
+
+
+class _BufferedSink(EventSink):
+	"""
+	Collect formatted events and write them in chunks
+	"""
+	def __init__(self, stream, level=INFO, bufsize=1 << 16):
+		super().__init__(level)
+		self.stream = stream
+		self.bufsize = bufsize
+		self._buffer = []
+		self._buffered = 0
+		self._lock = threading.Lock()
+
+	def _format(self, event):
+		raise NotImplementedError("'_format' not implemented in '%s'." % self.__class__)
+
+	def emit(self, event):
+		line = self._format(event)
+		with self._lock:
+			self._buffer.append(line)
+			self._buffered += len(line)
+			if self._buffered >= self.bufsize:
+				self._write()
+
+	def _write(self):
+		self.stream.write("".join(self._buffer))
+		self._buffer = []
+		self._buffered = 0
+
+	def flush(self):
+		with self._lock:
+			self._write()
+		self.stream.flush()
+
+
+class TextSink(_BufferedSink):
+	"""
+	Write events as human readable text (to stdout by default)
+
+	@param bufsize bytes collected before writing; by default, events for
+	stdout or a terminal are written at once, so they stay in order with
+	what the players print, and other streams are written in chunks
+	"""
+	def __init__(self, stream=None, level=INFO, bufsize=None):
+		stream = sys.stdout if stream is None else stream
+		if bufsize is None:
+			bufsize = 0 if stream is sys.stdout or stream.isatty() else 1 << 16
+		super().__init__(stream, level, bufsize)
+
+	def _format(self, event):
+		return str(event) + "\n"
+
+
+class JsonLinesSink(_BufferedSink):
+	"""
+	Write events as JSON objects, one per line
+
+	@param file file name or stream
+	"""
+	def __init__(self, file, level=INFO, bufsize=1 << 16):
+		self._ownStream = isinstance(file, str)
+		if self._ownStream:
+			file = open(file, "w")
+		super().__init__(file, level, bufsize)
+
+	def _format(self, event):
+		return json.dumps(event.as_dict(), separators=(",", ":")) + "\n"
+
+	def close(self):
+		self.flush()
+		if self._ownStream:
+			self.stream.close()
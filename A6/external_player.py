@@ -0,0 +1,162 @@
+import json
+import shlex
+import struct
+import subprocess
+
+import numpy as np
+
+from game_utils import Direction, MapWindow, TileStatus
+from player_base import Player
+
+# every message is the length of its payload as 4 byte unsigned big endian
+# integer, followed by the payload: a JSON object (which is valid YAML, too)
+_header = struct.Struct(">I")
+
+# symbol of every tile status value in the rows of a map
+_symbols = np.array([ ord(str(s)) for s in TileStatus ], dtype=np.uint8)
+
+
+def writeMessage(stream, message):
+	payload = json.dumps(message, separators=(",", ":")).encode()
+	stream.write(_header.pack(len(payload)) + payload)
+	stream.flush()
+
+
+def readMessage(stream):
+	"""
+	@returns the next message, None at the end of the stream
+	"""
+	header = stream.read(_header.size)
+	if len(header) < _header.size:
+		return None
+	size, = _header.unpack(header)
+	payload = stream.read(size)
+	if len(payload) < size:
+		return None
+	return json.loads(payload)
+
+
+def encodeStatus(status):
+	"""
+	The public status of a player as JSON object
+
+	The map is sent as the rectangle of tiles the player can see: its
+	lower left corner x0, y0 and the rows (from y0 upwards) as strings of
+	the tile symbols of the text maps, e.g. "..#&" (& is a mine); all
+	other tiles are unknown. Players and gold pots are listed separately.
+	With Simulator.deltaObservations, "delta" has the coordinates "x" and
+	"y" of the changed tiles and their symbols as string "tiles".
+	"""
+	m = status.map
+	if isinstance(m, MapWindow):
+		x0, y0, xu, yu = m.window
+		tiles = m._winStatus
+	else:
+		x0, y0 = 0, 0
+		tiles = m._status
+	rows = _symbols[tiles]
+	return {
+		"player": status.player,
+		"x": status.x,
+		"y": status.y,
+		"health": status.health,
+		"gold": status.gold,
+		"map": { "width": m.width, "height": m.height, "x0": x0, "y0": y0,
+			"rows": [ row.tobytes().decode() for row in rows ] },
+		"others": [ None if o is None else list(o) for o in status.others ],
+		"goldPots": [ [x, y, amount] for (x, y), amount in status.goldPots.items() ],
+		"goldPotRemainingRounds": getattr(status, "goldPotRemainingRounds", None),
+		"delta": None if status.delta is None else { "x": status.delta.x.tolist(), "y": status.delta.y.tolist(),
+			"tiles": _symbols[status.delta.status].tobytes().decode() },
+	}
+
+
+def encodeParams(params):
+	return { k: v for k, v in vars(params).items() if not k.startswith("_") }
+
+
+class ExternalPlayer(Player):
+	"""
+	Player whose decisions are made by an external program
+
+	The program is started once (at reset) and kept running for the whole
+	game. It reads requests from its standard input and writes one answer
+	per request to its standard output, as length prefixed JSON messages
+	(see writeMessage and the README); its standard error is passed
+	through. The requests are
+
+	{"command": "reset", "player_id": .., "max_players": .., "width": .., "height": .., "params": {..}}
+	{"command": "round_begin", "round": ..}
+	{"command": "set_mines", "status": {..}}
+	{"command": "move", "status": {..}}
+
+	with the status as in encodeStatus. The answers are {"name": ..} to
+	reset, {"mines": [[x, y], ..]} to set_mines, {"moves": ["up", ..]} (the
+	names of Direction) to move and anything to round_begin, or
+	{"error": message} if the program cannot answer.
+
+	@param command the command line of the program (list or string)
+	@param name name of the player until the program tells its own
+	"""
+	def __init__(self, command, name=None):
+		if isinstance(command, str):
+			command = shlex.split(command)
+		self.command = list(command)
+		self.player_name = name if name is not None else "External"
+		self._process = None
+
+	def _start(self):
+		self.close()
+		self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+	def close(self):
+		"""
+		Stop the program (it gets the end of its input)
+		"""
+		if self._process is None:
+			return
+		try:
+			self._process.stdin.close()
+			self._process.wait(timeout=1)
+		except (OSError, subprocess.TimeoutExpired):
+			self._process.kill()
+			self._process.wait()
+		self._process = None
+
+	def _request(self, message):
+		if self._process is None:
+			raise RuntimeError("%s: the program is not running" % self.player_name)
+		try:
+			writeMessage(self._process.stdin, message)
+			answer = readMessage(self._process.stdout)
+		except (BrokenPipeError, OSError):
+			answer = None
+		if answer is None:
+			code = self._process.poll()
+			self._process = None
+			raise RuntimeError("%s: the program stopped (exit code %s)" % (self.player_name, code))
+		if "error" in answer:
+			raise RuntimeError("%s: %s" % (self.player_name, answer["error"]))
+		return answer
+
+	def reset(self, player_id, max_players, width, height):
+		self._start()
+		status = getattr(self, "status", None)
+		answer = self._request({ "command": "reset", "player_id": player_id, "max_players": max_players,
+			"width": width, "height": height,
+			"params": encodeParams(status.params) if status is not None else None })
+		self.player_name = answer.get("name", self.player_name)
+
+	def round_begin(self, r):
+		self._request({ "command": "round_begin", "round": r })
+
+	def set_mines(self, status):
+		answer = self._request({ "command": "set_mines", "status": encodeStatus(status) })
+		return [ (int(x), int(y)) for x, y in answer.get("mines", []) ]
+
+	def move(self, status):
+		answer = self._request({ "command": "move", "status": encodeStatus(status) })
+		try:
+			return [ Direction[d] for d in answer.get("moves", []) ]
+		except KeyError as e:
+			raise ValueError("%s: unknown direction %s" % (self.player_name, e))
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class FreeCellPool(object):
+	"""
+	The free tiles of a map (Empty and without object), where players and
+	gold pots can be placed
+
+	The tiles are kept in an array, and the position of every tile in that
+	array in an array over the map, such that adding and removing a tile
+	(by swapping it with the last one) and drawing a random tile take
+	constant time, however full the map is. The simulator updates the
+	pool whenever a tile becomes free or taken.
+
+	@param map the map; the pool starts with its free tiles
+	"""
+	def __init__(self, map):
+		self.width = map.width
+		self.height = map.height
+		self.setstate(np.flatnonzero(map.freeMask()))
+
+	def getstate(self):
+		"""
+		@returns the tiles in the order of the pool (as flat indices
+		y*width + x), which makes the draws reproducible after setstate
+		"""
+		return self._cells[:self._n].copy()
+
+	def setstate(self, cells):
+		cells = np.asarray(cells, dtype=np.int64)
+		self._n = len(cells)
+		self._cells = np.empty(self.width*self.height, dtype=np.int64)
+		self._cells[:self._n] = cells
+		self._index = np.full(self.width*self.height, -1, dtype=np.int64)
+		self._index[cells] = np.arange(self._n)
+
+	def copy(self):
+		pool = FreeCellPool.__new__(FreeCellPool)
+		pool.width, pool.height = self.width, self.height
+		pool._n = self._n
+		pool._cells = self._cells.copy()
+		pool._index = self._index.copy()
+		return pool
+
+	def __len__(self):
+		return self._n
+
+	def __contains__(self, xy):
+		return self._index[xy[1]*self.width + xy[0]] >= 0
+
+	def contains(self, xs, ys):
+		"""
+		Which of the tiles (xs[i], ys[i]) are free, for int arrays xs and ys
+		"""
+		return self._index[ys*self.width + xs] >= 0
+
+	def add(self, xy):
+		"""
+		Add a tile which became free (nothing happens if it is in the pool)
+		"""
+		c = xy[1]*self.width + xy[0]
+		if self._index[c] < 0:
+			self._index[c] = self._n
+			self._cells[self._n] = c
+			self._n += 1
+
+	def discard(self, xy):
+		"""
+		Remove a tile which is taken (nothing happens if it isn't in the pool)
+		"""
+		c = xy[1]*self.width + xy[0]
+		i = self._index[c]
+		if i >= 0:
+			self._n -= 1
+			last = self._cells[self._n]
+			self._cells[i] = last
+			self._index[last] = i
+			self._index[c] = -1
+
+	def sample(self, rng):
+		"""
+		A uniformly random free tile
+
+		@param rng a random.Random
+		@raises RuntimeError if no tile is free
+		"""
+		if self._n == 0:
+			raise RuntimeError("No free tile left on the map.")
+		y, x = divmod(int(self._cells[rng.randrange(self._n)]), self.width)
+		return (x, y)
@@ -1,12 +1,20 @@
 from enum import Enum
-import random
-from collections import deque
+from collections import deque, namedtuple
 import copy
 
+import numpy as np
+
 def nameFromPlayerId(i):
+	"""
+	Name of a player in the board: a, b, ..., z, aa, ab, ..., zz, aaa, ...
+	"""
 	assert i >= 0
-	assert i <= ord("z") - ord("a") + 1
-	return chr(ord("a") + i)
+	name = ""
+	i += 1
+	while i > 0:
+		i, digit = divmod(i - 1, 26)
+		name = chr(ord("a") + digit) + name
+	return name
 
 
 class Direction(Enum):
@@ -109,13 +117,13 @@ class TileObject(object):
 		assert self.is_player()
 		return self._i
 
-	def __str__(self):
-		sym="."
+	def symbol(self):
 		if self.is_gold():
-			sym = "$"
-		elif self.is_player():
-			sym = chr(ord('A') + self._i)
-		return '\033[91m'+'\033[1m'+sym+'\033[0m'
+			return "$"
+		return nameFromPlayerId(self._i).upper()
+
+	def __str__(self):
+		return '\033[91m'+'\033[1m'+self.symbol()+'\033[0m'
 
 class Tile(object):
 	def __init__(self, status, obj=None):
@@ -124,7 +132,7 @@ class Tile(object):
 		self.status = status
 		self.obj = obj
 		if obj is not None:
-			assert not is_blocked()
+			assert not self.is_blocked()
 
 	def is_blocked(self):
 		return self.status.is_blocked()
@@ -136,44 +144,135 @@ class Tile(object):
 			return str(self.status)
 
 
+# tile status by value, for decoding the status array of maps
+_tileStatuses = tuple(TileStatus)
+
+# value in the object array of maps for 'no object'
+_noObject = -2
+
+
+class TileView(Tile):
+	"""
+	A tile of a map, which reads and writes the arrays of the map
+
+	Map.__getitem__ returns such views, such that code like
+	map[x, y].obj = None still modifies the map. Copies of a
+	view are plain Tile objects.
+	"""
+	__slots__ = ("_map", "_x", "_y")
+
+	def __init__(self, map, x, y):
+		self._map = map
+		self._x = x
+		self._y = y
+
+	@property
+	def status(self):
+		return _tileStatuses[self._map._status[self._y, self._x]]
+
+	@status.setter
+	def status(self, status):
+		self._map._status[self._y, self._x] = status.value
+
+	@property
+	def obj(self):
+		i = self._map._objects[self._y, self._x]
+		if i == _noObject:
+			return None
+		return TileObject(int(i))
+
+	@obj.setter
+	def obj(self, obj):
+		if obj is None:
+			self._map._objects[self._y, self._x] = _noObject
+		elif isinstance(obj, TileObject):
+			self._map._objects[self._y, self._x] = obj._i
+		else:
+			raise TypeError("Tile.obj must be a TileObject or None.")
+
+	def __copy__(self):
+		return Tile(self.status, self.obj)
+
+	def __deepcopy__(self, memo):
+		return Tile(self.status, self.obj)
+
+
 class Map(object):
+	"""
+	The board
+
+	The map is stored in two small integer arrays, indexed [y, x]: the
+	status (TileStatus values) and the objects (-1 for gold, the player id
+	for players, or _noObject) of all tiles.
+	"""
 	def __init__(self, width, height):
 		"""Make a map full of 'unknown'."""
 		self.width = int(width)
 		self.height = int(height)
 		assert width > 0
 		assert height > 0
-		self._data = []
-		for y in range(height):
-			row = []
-			for x in range(width):
-				row.append(Tile(TileStatus.Unknown))
-			self._data.append(row)
+		self._status = np.full((self.height, self.width), TileStatus.Unknown.value, dtype=np.int8)
+		self._objects = np.full((self.height, self.width), _noObject, dtype=np.int32)
 
 	def __str__(self):
-		return "\n".join(" ".join(str(tile) for tile in row) 
-			for row in reversed(self._data)) + "\n"
+		objects = [ (y, x, TileObject(int(self._objects[y, x])))
+					for y, x in zip(*np.nonzero(self._objects != _noObject)) ]
+		# with more than 26 players, all tiles are as wide as the longest name
+		width = max([ 1 ] + [ len(obj.symbol()) for y, x, obj in objects ])
+		symbols = np.array([ str(s).ljust(width) for s in _tileStatuses ], dtype=object)[self._status]
+		for y, x, obj in objects:
+			symbols[y, x] = str(obj) + " "*(width - len(obj.symbol()))
+		return "\n".join(" ".join(row) for row in reversed(symbols)) + "\n"
 
 	def __getitem__(self, coord):
 		assert coord[0] >= 0
 		assert coord[1] >= 0
 		assert coord[0] < self.width
 		assert coord[1] < self.height
-		return self._data[coord[1]][coord[0]]
+		return TileView(self, coord[0], coord[1])
 
 	def __setitem__(self, coord, val):
 		assert coord[0] >= 0
 		assert coord[1] >= 0
 		assert coord[0] < self.width
 		assert coord[1] < self.height
-		self._data[coord[1]][coord[0]] = val
+		self._status[coord[1], coord[0]] = val.status.value
+		obj = val.obj
+		self._objects[coord[1], coord[0]] = _noObject if obj is None else obj._i
+
+	def statusMask(self, status):
+		"""
+		Boolean array, indexed [y, x], of the tiles with the given status
+		"""
+		return self._status == status.value
+
+	def blockedMask(self):
+		"""
+		Boolean array, indexed [y, x], of the tiles blocked by walls or mines
+		"""
+		return (self._status == TileStatus.Wall.value) | (self._status == TileStatus.Mine.value)
+
+	def freeMask(self):
+		"""
+		Boolean array, indexed [y, x], of the empty tiles without objects
+		"""
+		return (self._status == TileStatus.Empty.value) & (self._objects == _noObject)
+
+	def clearObjects(self):
+		self._objects.fill(_noObject)
+
+	def applyDelta(self, delta):
+		"""
+		Set the status of the tiles listed in a MapDelta (Status.delta),
+		which keeps a map of everything seen so far up to date in time
+		proportional to the changes
+		"""
+		self._status[delta.y, delta.x] = delta.status
 
 	@staticmethod
 	def makeEmpty(width, height):
 		m = Map(width, height)
-		for y in range(height):
-			for x in range(width):
-				m._data[y][x] = Tile(TileStatus.Empty)
+		m._status.fill(TileStatus.Empty.value)
 		return m
 
 	# return the non-Wall (actually, non-blocked) neighbors of a field (x,y)
@@ -191,25 +290,12 @@ class Map(object):
 				neighbours.append((d, coord))
 		return neighbours
 
-	def _find_first_if(self,testfun):
-		for x in range(self.width):
-			for y in range(self.height):
-				if testfun(self._data[y][x]):
-					return (x,y)
-		return None
-
-	def _count_if(self,testfun):
-		count = 0
-		for x in range(self.width):
-			for y in range(self.height):
-				if testfun(self._data[y][x]):
-					count += 1
-		return count
-
 	def _connected(self):
-		def is_empty(x): return x.status == TileStatus.Empty
-
-		xy = self._find_first_if(is_empty)
+		empty = self.statusMask(TileStatus.Empty)
+		xs, ys = np.nonzero(empty.T)
+		if len(xs) == 0:
+			return True
+		xy = (int(xs[0]), int(ys[0]))
 
 		front = deque()
 		front.append(xy)
@@ -226,51 +312,183 @@ class Map(object):
 					front.append(neighbour)
 					accessible.add(neighbour)
 
-		return len(accessible) == self._count_if(is_empty)
+		return len(accessible) == np.count_nonzero(empty)
 
 	@staticmethod
-	def makeRandom(width, height, p):
-		## assume that p is not too large; otherwise
-		## resampling is very uneffective
-
-		assert p<=0.4
-
-		while True:
-			m = Map(width, height)
-			for y in range(height):
-				for x in range(width):
-					if random.random() < p:
-						s = TileStatus.Wall
-					else:
-						s = TileStatus.Empty
-					m._data[y][x] = Tile(s)
-
-			if m._connected():
-				return m
-			#print("Resample map")
-			#print(m)
+	def makeRandom(width, height, p, seed=None):
+		"""
+		Random connected map, where every field is a wall with probability p
+
+		@param seed seed of the map; by default drawn from the random module
+		"""
+		import mapgen
+		return mapgen.makeRandom(width, height, p, seed)
+
+	def write(self, filename, format=None):
+		"""
+		Write the status of all tiles (without objects) to a file
+
+		@param format "text" (the format of Maps/*.dat; only unknown, empty
+		and wall tiles), "bytes" (binary; one byte per tile, can be memory
+		mapped by read) or "bits" (binary; one bit per tile, only empty and
+		wall tiles); by default "text" for .dat files and "bytes" otherwise
+		"""
+		if format is None:
+			format = "text" if filename.endswith(".dat") else "bytes"
+		if format == "text":
+			symbols = TileStatus.strings()
+			if self._status.max(initial=0) >= len(symbols):
+				raise ValueError("Mines can't be written in the text format.")
+			symbols = np.array([ ord(s) for s in symbols ], dtype=np.uint8)[self._status]
+			lines = np.full((self.height, self.width + 1), ord("\n"), dtype=np.uint8)
+			lines[:, :-1] = symbols
+			with open(filename, "wb") as fh:
+				fh.write(lines.tobytes())
+		elif format in _mapEncodings:
+			if format == "bits":
+				if np.any((self._status != TileStatus.Empty.value) & (self._status != TileStatus.Wall.value)):
+					raise ValueError("Only empty and wall tiles can be written as bits.")
+				data = np.packbits(self.statusMask(TileStatus.Wall))
+			else:
+				data = np.ascontiguousarray(self._status, dtype=np.int8)
+			header = np.array([self.width, self.height, _mapEncodings[format], 0], dtype="<u4")
+			with open(filename, "wb") as fh:
+				fh.write(_mapMagic)
+				fh.write(header.tobytes())
+				fh.write(data.tobytes())
+		else:
+			raise ValueError("Unknown map format '%s'." % format)
 
 	@staticmethod
 	def read(filename):
-		## assume that p is not too large; otherwise
-		## resampling is very uneffective
-
-		def toTile(x):
-			return { '_': TileStatus.Unknown,
-					'.': TileStatus.Empty,
-					'#': TileStatus.Wall
-					}[x]
+		"""
+		Read a map written by write (in any format)
 
-		with open(filename) as fh:
-			data = [ [ Tile(TileStatus.unstr(x)) for x in line.strip() ]
-				for line in fh.readlines() ]
+		The tiles of the binary "bytes" format are memory mapped copy on
+		write, i.e. they are loaded lazily and changes don't touch the file.
+		"""
+		with open(filename, "rb") as fh:
+			data = fh.read(len(_mapMagic))
+			if data == _mapMagic:
+				width, height, encoding, reserved = np.frombuffer(fh.read(16), dtype="<u4").tolist()
+				m = Map(width, height)
+				offset = len(_mapMagic) + 16
+				if encoding == _mapEncodings["bytes"]:
+					m._status = np.memmap(filename, dtype=np.int8, mode="c", offset=offset,
+						shape=(height, width))
+				elif encoding == _mapEncodings["bits"]:
+					walls = np.unpackbits(np.frombuffer(fh.read(), dtype=np.uint8),
+						count=width*height).reshape(height, width)
+					m._status[:] = np.where(walls, TileStatus.Wall.value, TileStatus.Empty.value)
+				else:
+					raise ValueError("%s: unknown map encoding %d." % (filename, encoding))
+				return m
+			rows = (data + fh.read()).split()
 
-		height = len(data)
+		height = len(rows)
 		width=0
-		if height>0: width = len(data[0])
+		if height>0: width = len(rows[0])
+		if any(len(row) != width for row in rows):
+			raise ValueError("%s: the rows of the map differ in length." % filename)
 
 		m = Map(width,height)
-		m._data = data
+		status = _mapSymbols[np.frombuffer(b"".join(rows), dtype=np.uint8)]
+		if np.any(status < 0):
+			raise ValueError("%s: unknown symbol in the map." % filename)
+		m._status[:] = status.reshape(height, width)
+		return m
+
+
+# binary map files start with the magic bytes and a header of four little
+# endian uint32: width, height, encoding and 0
+_mapMagic = b"RRMAP\x00\x01\x00"
+_mapEncodings = { "bytes": 0, "bits": 1 }
+
+# tile status value of the symbols of text maps, -1 for others
+_mapSymbols = np.full(256, -1, dtype=np.int8)
+for _i, _s in enumerate(TileStatus.strings()):
+	_mapSymbols[ord(_s)] = _i
+
+
+class MapWindow(Map):
+	"""
+	Read-only view of the tiles of a map which a player can see
+
+	The view holds read-only copies of the status and object arrays of
+	the window [xl, xu] x [yl, yu] and of some extra visible tiles (the
+	gold pots); all other tiles are Unknown. Building it costs time and
+	memory proportional to the window instead of the whole map. Tiles
+	returned by __getitem__ are detached copies, so players cannot modify
+	the simulator's map through them.
+	"""
+	def __init__(self, map, xl, yl, xu, yu, extra=()):
+		self.width = map.width
+		self.height = map.height
+		self.window = (xl, yl, xu, yu)
+		window = np.s_[yl:yu + 1, xl:xu + 1]
+		self._winStatus = map._status[window].copy()
+		self._winObjects = map._objects[window].copy()
+		self._winStatus.flags.writeable = False
+		self._winObjects.flags.writeable = False
+		# (x, y) -> (status value, object value) of visible tiles outside the window
+		self._extra = { (x, y): (int(map._status[y, x]), int(map._objects[y, x]))
+						for (x, y) in extra
+						if not (xl <= x <= xu and yl <= y <= yu) }
+		self._full = None
+
+	def _materialize(self):
+		if self._full is None:
+			status = np.full((self.height, self.width), TileStatus.Unknown.value, dtype=np.int8)
+			objects = np.full((self.height, self.width), _noObject, dtype=np.int32)
+			xl, yl, xu, yu = self.window
+			status[yl:yu + 1, xl:xu + 1] = self._winStatus
+			objects[yl:yu + 1, xl:xu + 1] = self._winObjects
+			for (x, y), (s, o) in self._extra.items():
+				status[y, x] = s
+				objects[y, x] = o
+			status.flags.writeable = False
+			objects.flags.writeable = False
+			self._full = (status, objects)
+		return self._full
+
+	# whole-map operations of Map work on the (read-only) full arrays
+	@property
+	def _status(self):
+		return self._materialize()[0]
+
+	@property
+	def _objects(self):
+		return self._materialize()[1]
+
+	def __getitem__(self, coord):
+		assert coord[0] >= 0
+		assert coord[1] >= 0
+		assert coord[0] < self.width
+		assert coord[1] < self.height
+		x, y = coord
+		xl, yl, xu, yu = self.window
+		if xl <= x <= xu and yl <= y <= yu:
+			s = self._winStatus[y - yl, x - xl]
+			o = self._winObjects[y - yl, x - xl]
+		elif (x, y) in self._extra:
+			s, o = self._extra[x, y]
+		else:
+			return Tile(TileStatus.Unknown)
+		return Tile(_tileStatuses[s], None if o == _noObject else TileObject(int(o)))
+
+	def __setitem__(self, coord, val):
+		raise TypeError("The map of the public status is read-only.")
+
+	def clearObjects(self):
+		raise TypeError("The map of the public status is read-only.")
+
+	def toMap(self):
+		"""
+		Return a modifiable Map with the visible tiles
+		"""
+		m = Map(self.width, self.height)
+		m._status[:] = self._status
+		m._objects[:] = self._objects
 		return m
 
  
@@ -293,6 +511,9 @@ class GameParameters(object):
 		self.healthPerPlayerCrashRandom = 5
 
 		self.moveTimeout = 2 # players get at most moveTimeout seconds to answer each move request
+		self.roundBeginTimeout = 2 # the same for round_begin
+		self.setMinesTimeout = 2 # and for set_mines
+		self.resetTimeout = 2 # and for reset, when a player is restarted after a timeout
 
 		self.mineExpiryTime = 3 # how many rounds do mines exist
 
@@ -305,6 +526,14 @@ class GameParameters(object):
 			self._cost.append( self.cost(actions-1)+actions )
 		return self._cost[actions]
 
+# what players get to know about other players in their visibility range
+OtherPlayer = namedtuple("OtherPlayer", ["player", "x", "y", "health", "gold"])
+
+# the tiles a player sees for the first time or which changed since its
+# previous observation: int arrays of the x and y coordinates and the
+# status values of the tiles (see Map.applyDelta)
+MapDelta = namedtuple("MapDelta", ["x", "y", "status"])
+
 class Status(object):
 	def __init__(self, player, *, x, y, health, gold=0, params=None):
 		self.player = player
@@ -317,8 +546,9 @@ class Status(object):
 		self.params = copy.deepcopy(params)
 
 		self.map = None # limited info about map
-		self.others = None # limited info about other players in the visibility range
+		self.others = None # list of OtherPlayer (or None) for the players in the visibility range
 		self.goldPots = None # dict: (x, y) -> amount
+		self.delta = None # MapDelta of the map, if the simulator sends deltas
 
 	def __str__(self):
 		s="Player "+str(self.player)+"\n"
@@ -1,18 +1,30 @@
+import glob
+import json
+import os
+import sys
+
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import numpy as np
 
+from game_utils import TileStatus
+
 
 class Illustrator:
-    def __init__(self, m, vizfile, framerate):
-        self.robotspos = []
-        self.robotshealth = []
-        self.robotsmoney = []
-        self.goldpos = []
-        self.goldamount = []
-        self.minepos = []
-        self.minetime = []
+    """
+    Collect the state of the game every round and render it as a video
+
+    The data of each round is collected in chunks of arrays. By default,
+    the chunks are kept in memory and rendered at the end of the game.
+    With a streamdir, every completed chunk is written to that directory
+    right away and dropped from memory; the video can then be rendered
+    from the directory at any time, even after the game crashed:
+
+        python illustrator.py streamdir video.mp4
+    """
+    TRAIL = 5  # number of previous rounds shown as trail
 
+    def __init__(self, m, vizfile, framerate, streamdir=None, chunksize=100):
         self.width = m.width
         self.height = m.height
         self.markersize = (200*900)/(self.width*self.height)
@@ -22,23 +34,42 @@ class Illustrator:
 
         self.FRAME_PER_SECOND = framerate
         self.vizfile = vizfile
+        self.streamdir = streamdir
+        self.chunksize = chunksize
+        # only collect data if it is going to be used
+        self.active = vizfile is not None or streamdir is not None
+
+        self.n_rounds = 0
+        self._chunks = []  # completed chunks (if not streaming)
+        self._nchunks = 0
+        self._round = {}   # data of the current round
+        self._buffer = {}  # data of the rounds of the current chunk
+        self._cache = {}   # chunk index -> chunk, for rendering
 
     def find_walls(self, m):
-        self.walls = [
-            (x, y)
-            for y, row in enumerate(m._data)
-            for x, tile in enumerate(row)
-            if str(tile) == '#'
-        ]
+        ys, xs = np.nonzero(m.statusMask(TileStatus.Wall))
+        self.walls = list(zip(xs.tolist(), ys.tolist()))
 
     def _add_robots(self, robots):
         self.n_robots = len(robots)
         self.robot_names = [robot.player_name for robot in robots]
-
-    def _add_nrounds(self, rounds):
-        self.n_rounds = rounds
+        if self.streamdir is not None:
+            os.makedirs(self.streamdir, exist_ok=True)
+            for f in glob.glob(os.path.join(self.streamdir, "chunk_*.npz")):
+                os.remove(f)
+            with open(os.path.join(self.streamdir, "meta.json"), "w") as fh:
+                json.dump({
+                    "width": self.width,
+                    "height": self.height,
+                    "walls": self.walls,
+                    "robot_names": self.robot_names,
+                    "framerate": self.FRAME_PER_SECOND,
+                    "chunksize": self.chunksize,
+                }, fh)
 
     def append_robots(self, robots):
+        if not self.active:
+            return
         rpos, rhealth, rmoney = [], [], []
         for robot in robots:
             rpos.append([robot.status.x, robot.status.y])
@@ -48,20 +79,98 @@ class Illustrator:
         maxmoney = max(rmoney)
         rmoney = [80*money/maxmoney+25 for money in rmoney]
 
-        self.robotspos.append(rpos)
-        self.robotshealth.append(rhealth)
-        self.robotsmoney.append(rmoney)
+        self._round["robotspos"] = rpos
+        self._round["robotshealth"] = rhealth
+        self._round["robotsmoney"] = rmoney
 
     def append_goldpots(self, goldpots):
-        self.goldpos.append(list(goldpots.keys()))
-        self.goldamount.append(list(goldpots.values()))
+        if not self.active:
+            return
+        self._round["goldpos"] = list(goldpots.keys())
+        self._round["goldamount"] = list(goldpots.values())
 
     def append_mines(self, mines):
+        if not self.active:
+            return
         minepos = list(mines.keys()) + [(-1,-1)]
         minepos = minepos*5
         minepos = minepos[:5]
-        self.minepos.append(minepos)
-        self.minetime.append(list(mines.values()))
+        self._round["minepos"] = minepos
+        self._end_round()
+
+    def _end_round(self):
+        for key, value in self._round.items():
+            self._buffer.setdefault(key, []).append(value)
+        self._round = {}
+        self.n_rounds += 1
+        if len(self._buffer["minepos"]) >= self.chunksize:
+            self._end_chunk()
+
+    def _end_chunk(self):
+        if not self._buffer:
+            return
+        # the number of gold pots can change, so pad them to the same length
+        n = max(len(pots) for pots in self._buffer["goldpos"])
+        self._buffer["goldpos"] = [ pots + [(-1,-1)]*(n - len(pots)) for pots in self._buffer["goldpos"] ]
+        self._buffer["goldamount"] = [ amounts + [0]*(n - len(amounts)) for amounts in self._buffer["goldamount"] ]
+        chunk = { key: np.array(values).reshape(len(values), -1, 2) if key == "goldpos"
+                  else np.array(values) for key, values in self._buffer.items() }
+        self._buffer = {}
+        if self.streamdir is not None:
+            np.savez(os.path.join(self.streamdir, "chunk_%06d.npz" % self._nchunks), **chunk)
+        else:
+            self._chunks.append(chunk)
+        self._nchunks += 1
+
+    def finish(self):
+        """
+        Write the remaining data; call at the end of the game
+        """
+        if self.active:
+            self._end_chunk()
+
+    def _chunk(self, k):
+        if self.streamdir is None:
+            return self._chunks[k]
+        if k not in self._cache:
+            # keep only the chunks needed for the current frame and its trail
+            for old in [ old for old in self._cache if old < k - 1 ]:
+                del self._cache[old]
+            with np.load(os.path.join(self.streamdir, "chunk_%06d.npz" % k)) as data:
+                self._cache[k] = { key: data[key] for key in data.files }
+        return self._cache[k]
+
+    def _frame(self, key, i):
+        return self._chunk(i // self.chunksize)[key][i % self.chunksize]
+
+    @staticmethod
+    def load(streamdir, vizfile):
+        """
+        Return an illustrator for rendering the data in a streamdir
+        """
+        with open(os.path.join(streamdir, "meta.json")) as fh:
+            meta = json.load(fh)
+        illustrator = Illustrator.__new__(Illustrator)
+        illustrator.width = meta["width"]
+        illustrator.height = meta["height"]
+        illustrator.markersize = (200*900)/(illustrator.width*illustrator.height)
+        illustrator.linewidth = (7*900)/(illustrator.width*illustrator.height)
+        illustrator.walls = [ tuple(xy) for xy in meta["walls"] ]
+        illustrator.robot_names = meta["robot_names"]
+        illustrator.n_robots = len(illustrator.robot_names)
+        illustrator.FRAME_PER_SECOND = meta["framerate"]
+        illustrator.chunksize = meta["chunksize"]
+        illustrator.vizfile = vizfile
+        illustrator.streamdir = streamdir
+        illustrator.active = False
+        illustrator._cache = {}
+        chunks = sorted(glob.glob(os.path.join(streamdir, "chunk_*.npz")))
+        illustrator._nchunks = len(chunks)
+        illustrator.n_rounds = 0
+        if chunks:
+            last = illustrator._chunk(len(chunks) - 1)
+            illustrator.n_rounds = (len(chunks) - 1) * illustrator.chunksize + len(last["minepos"])
+        return illustrator
 
     def _illustrate(self):
         fig, self.ax = plt.subplots(
@@ -116,9 +225,6 @@ class Illustrator:
             x=[], y=[], marker='X', edgecolors='k', c='red')
 
     def illustrate_round(self, i):
-        def pivot(array):
-            return list(zip(*array))
-
         if not (i+1) % 10:
             print('illustrating step', i+1)
 
@@ -127,20 +233,26 @@ class Illustrator:
         self.ax.set_title(title, fontsize=20)
 
         # goldpots
-        self.goldpots.set_offsets(self.goldpos[i])
-        self.goldpots.set_sizes(self.goldamount[i])
+        self.goldpots.set_offsets(self._frame("goldpos", i))
+        self.goldpots.set_sizes(self._frame("goldamount", i))
 
         # robots
-        self.robot.set_offsets(self.robotspos[i])
-        self.robot.set_sizes(self.robotsmoney[i])
-        self.robot.set_array(np.array(self.robotshealth[i]))
+        self.robot.set_offsets(self._frame("robotspos", i))
+        self.robot.set_sizes(self._frame("robotsmoney", i))
+        self.robot.set_array(np.array(self._frame("robotshealth", i)))
 
         # mines
-        self.mines.set_offsets(self.minepos[i])
+        self.mines.set_offsets(self._frame("minepos", i))
 
         # trails
-        lo = [0, i-5][i-5 >= 0]
-        offsets = pivot(self.robotspos[lo:i+1])
-        for trail, offset in zip(self.trails, offsets):
-            x, y = pivot(list(offset))
-            trail.set_data(list(x), list(y))
+        lo = max(i - self.TRAIL, 0)
+        offsets = np.array([ self._frame("robotspos", j) for j in range(lo, i+1) ])
+        for robot, trail in enumerate(self.trails):
+            trail.set_data(offsets[:, robot, 0], offsets[:, robot, 1])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: %s streamdir vizfile" % sys.argv[0])
+        sys.exit(1)
+    Illustrator.load(sys.argv[1], sys.argv[2])._illustrate()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+import argparse
+import random
+import time
+
+import numpy as np
+
+from game_utils import Map, TileStatus
+
+def _rng(seed):
+	"""
+	numpy generator for a seed; without a seed, it is drawn from python's
+	random module, so random.seed() makes the maps reproducible
+	"""
+	if seed is None:
+		seed = random.getrandbits(64)
+	return np.random.default_rng(seed)
+
+
+def _runComponents(free):
+	"""
+	The horizontal runs of free fields are connected anyway, so they are
+	the nodes of the search. Two runs in neighboring rows are joined if
+	any of their fields are neighbors. The components of the runs are
+	found by union-find on all runs at once: every pass hooks the roots of
+	all joined runs in different components onto the smaller root and
+	compresses the paths by pointer jumping, until all joined runs have the
+	same root.
+
+	@returns the run of every field (meaningless for walls), the root of
+	the component of every run and the length of every run
+	"""
+	height, width = free.shape
+	# runs start at free fields without a free left neighbor
+	starts = free.copy()
+	starts[:, 1:] &= ~free[:, :-1]
+	run = (np.cumsum(starts.ravel(), dtype=np.int32) - 1).reshape(free.shape)
+	nruns = int(starts.sum())
+	if nruns == 0:
+		return run, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+	# runs in the next row are joined with the runs of this row which
+	# overlap them or touch them diagonally; for a field, the first run
+	# ending at it or later is the number of runs started before it, and
+	# the number of runs started up to it is the end of such runs
+	counts = run.ravel() + 1
+	firstFrom = counts - free.ravel()
+	ys, xs = np.divmod(np.flatnonzero(starts), width)
+	ends = free.copy()
+	ends[:, :-1] &= ~free[:, 1:]
+	xe = np.flatnonzero(ends) % width
+	above = np.maximum(ys - 1, 0)*width
+	first = firstFrom[above + np.maximum(xs - 1, 0)]
+	last = counts[above + np.minimum(xe + 1, width - 1)]
+	count = np.where(ys > 0, np.maximum(last - first, 0), 0)
+	b = np.repeat(np.arange(nruns, dtype=np.int32), count)
+	a = (np.repeat(first - np.cumsum(count) + count, count) + np.arange(count.sum())).astype(np.int32)
+
+	parent = np.arange(nruns, dtype=np.int32)
+	while a.size:
+		ra, rb = parent[a], parent[b]
+		differ = ra != rb
+		a, b, ra, rb = a[differ], b[differ], ra[differ], rb[differ]
+		if not a.size:
+			break
+		# hook the larger root onto the smaller one (no cycles)
+		parent[np.maximum(ra, rb)] = np.minimum(ra, rb)
+		# pointer jumping
+		while True:
+			grandparent = parent[parent]
+			if np.array_equal(grandparent, parent):
+				break
+			parent = grandparent
+
+	return run, parent, xe - xs + 1
+
+
+def components(free):
+	"""
+	Label the 8-connected components of the free fields
+
+	@param free boolean array indexed [y,x]
+	@returns int array indexed [y,x] with the same label for the fields
+	of a component, -1 for walls
+	"""
+	run, root, length = _runComponents(free)
+	if len(root) == 0:
+		return np.full(free.shape, -1)
+	return np.where(free, root[run], -1)
+
+
+def connect(free):
+	"""
+	Make the free fields connected by walling in all but the largest component
+
+	@param free boolean array indexed [y,x]; changed in place
+	@returns free
+	"""
+	run, root, length = _runComponents(free)
+	if len(root) > 0:
+		largest = np.argmax(np.bincount(root, weights=length))
+		free &= root[run] == largest
+	return free
+
+
+def toMap(free):
+	"""
+	Map with walls where free is False
+	"""
+	height, width = free.shape
+	m = Map(width, height)
+	m._status[:] = np.where(free, TileStatus.Empty.value, TileStatus.Wall.value)
+	return m
+
+
+def makeRandom(width, height, p, seed=None):
+	"""
+	Random connected map: every field is a wall with probability p
+
+	Fields which are not connected to the largest free region become walls,
+	so the density of the result is a bit higher than p (noticeably only
+	for p close to 0.6, where the free fields stop percolating).
+	"""
+	assert 0 <= p < 1
+	free = _rng(seed).random((height, width)) >= p
+	return toMap(connect(free))
+
+
+def makeMaze(width, height, seed=None, loops=0.0):
+	"""
+	Random maze of corridors of width 1, generated by the binary tree
+	algorithm: every room (at even coordinates) opens the wall to its
+	right or the wall below it.
+
+	@param loops fraction of the remaining inner walls (between two
+	rooms) which are removed to create loops
+	"""
+	rng = _rng(seed)
+	free = np.zeros((height, width), dtype=bool)
+	free[::2, ::2] = True
+	rh, rw = free[::2, ::2].shape
+
+	# each room opens right or down; rooms in the last column open down,
+	# rooms in the last row open right
+	down = rng.random((rh, rw)) < 0.5
+	down[:, -1] = True
+	down[-1, :] = False
+	right = ~down
+	right[-1, -1] = False
+	# the walls between rooms at (2i,2j+1) resp. (2i+1,2j)
+	hwalls = free[::2, 1::2]
+	vwalls = free[1::2, ::2]
+	hwalls |= right[:, :hwalls.shape[1]]
+	vwalls |= down[:vwalls.shape[0], :]
+	if loops > 0:
+		hwalls |= rng.random(hwalls.shape) < loops
+		vwalls |= rng.random(vwalls.shape) < loops
+	# the rooms and openings form a tree, so the maze is connected; on maps
+	# of even width or height, the fields at the boundary opened by loops
+	# are dead ends
+	return toMap(free)
+
+
+def makeCave(width, height, p=0.45, iterations=4, seed=None):
+	"""
+	Random cave by a cellular automaton: starting from random walls with
+	probability p, a field becomes a wall if at least 5 of the 9 fields
+	around it (including itself) are walls; the boundary counts as wall.
+	"""
+	walls = _rng(seed).random((height, width)) < p
+	for i in range(iterations):
+		padded = np.ones((height + 2, width + 2), dtype=np.int8)
+		padded[1:-1, 1:-1] = walls
+		count = sum(padded[1+dy:height+1+dy, 1+dx:width+1+dx]
+			for dy in (-1,0,1) for dx in (-1,0,1))
+		walls = count >= 5
+	return toMap(connect(~walls))
+
+
+generators = {
+	"random": makeRandom,
+	"maze": makeMaze,
+	"cave": makeCave,
+}
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Generate a connected random map")
+	parser.add_argument('style', help="style of the map", choices=sorted(generators))
+	parser.add_argument('width', type=int)
+	parser.add_argument('height', type=int)
+	parser.add_argument('--density', help="probability of walls (random and cave)", type=float, default=None)
+	parser.add_argument('--loops', help="fraction of maze walls to remove", type=float, default=0.0)
+	parser.add_argument('--seed', type=int, default=None)
+	parser.add_argument('--output', help="write the map to this file instead of printing it (see Map.write)", type=str, default=None)
+	args = parser.parse_args()
+
+	kwargs = { "seed": args.seed }
+	if args.density is not None:
+		kwargs["p"] = args.density
+	elif args.style == "random":
+		kwargs["p"] = 0.3
+	if args.style == "maze":
+		kwargs = { "seed": args.seed, "loops": args.loops }
+
+	start = time.time()
+	m = generators[args.style](args.width, args.height, **kwargs)
+	print("Generated %dx%d %s map in %.2fs" % (args.width, args.height, args.style, time.time() - start))
+	if args.output is None:
+		print(m)
+	else:
+		m.write(args.output)
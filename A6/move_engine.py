@@ -0,0 +1,266 @@
+from game_utils import nameFromPlayerId
+from game_utils import MoveStatus, TileStatus, TileObject
+from events import DEBUG
+
+
+def find_crashes(moves):
+	"""
+	Find the players which crash into each other in one lock-step move
+
+	@param moves list of (from, to) positions per player; players which
+	don't move have from == to. The moves of crashed players are replaced
+	by (from, from).
+	@returns set of the ids of the crashed players
+
+	Players crash if
+	  1) two or more players move to the same position; this
+	     includes that one of the players does not move
+	  2) two players swap positions (crossing paths)
+	Crashed players stay where they are, which can cause further crashes.
+	Only the positions where players stop need to be checked again, so the
+	fix point is found in time linear in the number of players.
+	"""
+	# position -> set of players moving there
+	targets = {}
+	for pId, (now, then) in enumerate(moves):
+		targets.setdefault(then, set()).add(pId)
+
+	# check crash of type (1)
+	crashed = set()
+	for group in targets.values():
+		if len(group) > 1:
+			crashed.update(group)
+
+	# check crash of type (2)
+	moving = { move: pId for pId, move in enumerate(moves) if move[0] != move[1] }
+	for (now, then), pId in moving.items():
+		if (then, now) in moving:
+			crashed.add(pId)
+
+	# stop crashed players and check for crashes at their positions
+	todo = list(crashed)
+	while todo:
+		pId = todo.pop()
+		now, then = moves[pId]
+		if now == then:
+			continue
+		targets[then].discard(pId)
+		moves[pId] = now, now
+		group = targets.setdefault(now, set())
+		group.add(pId)
+		if len(group) > 1:
+			for other in group:
+				if other not in crashed:
+					crashed.add(other)
+					todo.append(other)
+	return crashed
+
+
+# events reported for unsuccessful moves
+_moveEvents = {
+	MoveStatus.CrashWall: "crash_wall",
+	MoveStatus.CrashPlayer: "crash_player",
+	MoveStatus.OutOfGold: "out_of_gold",
+	MoveStatus.OutOfHealth: "out_of_health",
+	MoveStatus.Cancelled: "cancelled",
+}
+
+
+class MoveEngine(object):
+	"""
+	Carry out the moves of all players of one round in lock-step
+
+	Resolves payment, crashes into walls (including mines and the
+	boundary), crashes between players, health damage, taking gold pots
+	and updating the positions on the simulator's map.
+	"""
+	def __init__(self, sim):
+		self.sim = sim
+
+	def run(self, movesPerPlayer):
+		"""
+		@param movesPerPlayer list of the moves (Directions) of each player
+		@returns list of the MoveStatus of every move of each player
+		"""
+		sim = self.sim
+		self.movesPerPlayer = movesPerPlayer
+		self.moveStatusPerPlayer = [ [MoveStatus.Pending for m in moves]
+									for moves in movesPerPlayer ]
+		if sim._debugMoves:
+			for pId, moves in enumerate(movesPerPlayer):
+				sim._log("debug", DEBUG, message="%s; [%s]" %
+					(nameFromPlayerId(pId), ", ".join(str(m) for m in moves)))
+
+		# players which may still have pending moves
+		self._active = set(pId for pId, moves in enumerate(movesPerPlayer) if len(moves) > 0)
+
+		# do a move for each player in lock-step
+		maxNumMoves = max((len(ms) for ms in movesPerPlayer), default=0)
+		for mId in range(maxNumMoves):
+			self._active = set(pId for pId in self._active if mId < len(movesPerPlayer[pId]))
+			if self._active:
+				self._step(mId)
+			else:
+				# only cancelled moves are left, which still have to be paid
+				self._step_cancelled(mId)
+		return self.moveStatusPerPlayer
+
+	def _cancelRest(self, pId, mId):
+		moveStatus = self.moveStatusPerPlayer[pId]
+		for i in range(mId + 1, len(moveStatus)):
+			moveStatus[i] = MoveStatus.Cancelled
+		self._active.discard(pId)
+
+	def _step_cancelled(self, mId):
+		sim = self.sim
+		for pId in range(len(self.movesPerPlayer)):
+			if mId < len(self.movesPerPlayer[pId]):
+				assert self.moveStatusPerPlayer[pId][mId] == MoveStatus.Cancelled
+				sim._pay_for_task(pId)
+		self._report(mId)
+
+	def _step(self, mId):
+		sim = self.sim
+		movesPerPlayer = self.movesPerPlayer
+		moveStatusPerPlayer = self.moveStatusPerPlayer
+
+		# collect all pairs of positions,
+		# and evaluate if the player is actually allowed to move
+		moves = [None for p in movesPerPlayer]
+		for pId in range(len(movesPerPlayer)):
+			now = sim._status[pId].x, sim._status[pId].y
+			then = now
+			moves[pId] = (now, then)
+			# first, this player may actually have no more moves
+			if mId >= len(movesPerPlayer[pId]):
+				continue
+			# a player must _always_ pay for a move, even though it is not carried out
+			paid = sim._pay_for_task(pId)
+			# a previous move in this round could have cancelled this move
+			if moveStatusPerPlayer[pId][mId] == MoveStatus.Cancelled:
+				continue
+			assert moveStatusPerPlayer[pId][mId] == MoveStatus.Pending
+
+			# if we can't pay, don't move, and cancel everything afterwards
+			if not paid:
+				moveStatusPerPlayer[pId][mId] = MoveStatus.OutOfGold
+				self._cancelRest(pId, mId)
+				continue
+
+			# if we are too weak then we can't move either
+			if sim._status[pId].health < sim.params.minMoveHealth:
+				moveStatusPerPlayer[pId][mId] = MoveStatus.OutOfHealth
+				if sim.printEvents:
+					sim._log("too_weak", player=pId)
+				continue
+
+			# otherwise, actually try to move
+			moveStatusPerPlayer[pId][mId] = MoveStatus.Done
+			diff = movesPerPlayer[pId][mId].as_xy()
+			then = now[0] + diff[0], now[1] + diff[1]
+			moves[pId] = (now, then)
+
+		# check collisions
+		# - with walls or the boundary
+		for pId in range(len(moves)):
+			if mId >= len(movesPerPlayer[pId]):
+				continue
+			if moveStatusPerPlayer[pId][mId] != MoveStatus.Done:
+				continue
+			dest = moves[pId][1]
+			if (
+				dest[0] < 0 or dest[0] >= sim.map.width
+				or dest[1] < 0 or dest[1] >= sim.map.height
+				or sim.map._status[dest[1], dest[0]] != TileStatus.Empty.value
+				):
+				moveStatusPerPlayer[pId][mId] = MoveStatus.CrashWall
+				self._cancelRest(pId, mId)
+				moves[pId] = moves[pId][0], moves[pId][0]
+
+		# - with other players
+		for pId in find_crashes(moves):
+			if mId < len(movesPerPlayer[pId]):
+				moveStatusPerPlayer[pId][mId] = MoveStatus.CrashPlayer
+				self._cancelRest(pId, mId)
+
+		# update health after crashes
+		for pId in range(len(moves)):
+			if mId >= len(movesPerPlayer[pId]):
+				continue
+			ms = moveStatusPerPlayer[pId][mId]
+			if ms == MoveStatus.CrashWall:
+				sim._decrease_health(pId, sim.params.healthPerWallCrash)
+			elif ms == MoveStatus.CrashPlayer:
+				sim._decrease_health(pId,
+					sim.params.healthPerPlayerCrash
+					+ sim.rng.randint(0,sim.params.healthPerPlayerCrashRandom))
+
+		self._report(mId)
+
+		# update positions
+		# - first remove them
+		toUpdate = []
+		for pId in range(len(moves)):
+			if mId >= len(movesPerPlayer[pId]):
+				continue
+			if moveStatusPerPlayer[pId][mId] != MoveStatus.Done:
+				continue
+			if sim.printMoves:
+				sim._log("moved", player=pId, name=nameFromPlayerId(pId),
+					direction=str(movesPerPlayer[pId][mId]))
+			toUpdate.append(pId)
+			assert sim.map[moves[pId][0]].obj is not None
+			assert sim.map[moves[pId][0]].obj.is_player(pId)
+			sim.map[moves[pId][0]].obj = None
+			sim._freeCells.add(moves[pId][0])
+		# - then add them again at new positions
+		#   ... while taking gold
+		numGoldPotsTaken = 0
+		for pId in toUpdate:
+			destObj = sim.map[moves[pId][1]].obj
+			if destObj is not None:
+				assert destObj.is_gold()
+				amount = sim._goldPots[moves[pId][1]]
+				if sim.printEvents:
+					sim._log("pot_taken", player=pId, name=nameFromPlayerId(pId), amount=amount)
+				sim._status[pId].gold += amount
+				del sim._goldPots[moves[pId][1]]
+				numGoldPotsTaken += 1
+			sim.map[moves[pId][1]].obj = TileObject.makePlayer(pId)
+			sim._freeCells.discard(moves[pId][1])
+			sim._status[pId].x, sim._status[pId].y = moves[pId][1]
+			sim._playerIndex.move(pId, moves[pId][1])
+		#relocate other gold pots(starts new timer)
+		if numGoldPotsTaken>0:
+			if (sim.params.maxNumGoldPots-numGoldPotsTaken)>0:
+				sim._empty_and_relocate_gold_pots()
+			else:
+				sim.goldPotRemainingRounds = sim.params.goldPotTimeOut
+		for i in range(numGoldPotsTaken):
+			sim._add_gold_pot()
+
+	def _report(self, mId):
+		sim = self.sim
+		movesPerPlayer = self.movesPerPlayer
+		moveStatusPerPlayer = self.moveStatusPerPlayer
+
+		# report unsuccessful moves
+		if sim._debugMoves:
+			sim._log("debug", DEBUG, message="move round %d" % mId)
+			for pId in range(len(movesPerPlayer)):
+				sim._log("debug", DEBUG, message="move status %s; [%s]" % (nameFromPlayerId(pId),
+					", ".join(str(m) for m in moveStatusPerPlayer[pId])))
+		if sim.printEvents:
+			for pId in range(len(movesPerPlayer)):
+				if mId >= len(movesPerPlayer[pId]):
+					continue
+				ms = moveStatusPerPlayer[pId][mId]
+				assert ms != MoveStatus.Pending
+				if ms == MoveStatus.Done:
+					continue
+				if ms in _moveEvents:
+					sim._log(_moveEvents[ms], player=pId, name=nameFromPlayerId(pId),
+						direction=str(movesPerPlayer[pId][mId]))
+				else:
+					sim._log("bug", message="%s could not move due to some strange reason (debug: ms == %s)." %
+						(nameFromPlayerId(pId), str(ms)))
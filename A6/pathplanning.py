@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+import heapq
+
+import numpy as np
+
+from game_utils import TileStatus
+
+
+class PathPlanner:
+    """
+    Single shortest paths on a map by A* or jump point search
+
+    Unlike AllShortestPaths, only the part of the map which is needed for
+    one path is searched. Moves go to any of the 8 neighbors which are no
+    walls (also diagonally between two walls) and cost 1 each, so the
+    Chebyshev distance (see Simulator._distance) is an exact heuristic on
+    maps without walls.
+
+    @param map the map; only walls are obstacles
+    """
+    def __init__(self, map):
+        self.width = map.width
+        self.height = map.height
+        # padded with walls and flattened; index of (x,y) is (x+1)*stride + y+1
+        self._stride = stride = self.height + 2
+        free = np.zeros((self.width + 2, stride), dtype=bool)
+        free[1:-1, 1:-1] = ~map.statusMask(TileStatus.Wall).T
+        self._free = free.ravel().tolist()
+        self._steps = [dx*stride + dy for dx in (-1,0,1) for dy in (-1,0,1) if (dx,dy) != (0,0)]
+        # number of nodes expanded by the last search
+        self.expansions = 0
+
+    def _index(self, xy):
+        return (xy[0] + 1)*self._stride + xy[1] + 1
+
+    def _xy(self, i):
+        return (i // self._stride - 1, i % self._stride - 1)
+
+    def _heuristic(self, i, goal):
+        # Chebyshev distance
+        s = self._stride
+        return max(abs(i // s - goal // s), abs(i % s - goal % s))
+
+    def shortestPath(self, start, goal, method="jps"):
+        """
+        Shortest path from start to goal
+
+        @param method "astar" or "jps"
+        @returns the path in the format of AllShortestPaths.shortestPathFrom:
+        the fields from start (included) to goal (excluded); [] if start is
+        the goal or the goal can't be reached
+        """
+        if method == "astar":
+            return self.astar(start, goal)
+        elif method == "jps":
+            return self.jps(start, goal)
+        raise ValueError("Unknown method '%s'." % method)
+
+    def _search(self, start, goal, successors):
+        """
+        A* over the nodes given by successors(node, parent, goal), which
+        yields (node, cost); returns the parents of the reached nodes
+        """
+        s, g = self._index(start), self._index(goal)
+        self.expansions = 0
+        if s == g or not self._free[g]:
+            return s, g, None
+        parent = { s: None }
+        cost = { s: 0 }
+        closed = set()
+        # ties are broken towards deeper nodes
+        heap = [ (self._heuristic(s, g), 0, s) ]
+        while heap:
+            f, negcost, node = heapq.heappop(heap)
+            if node in closed:
+                continue
+            if node == g:
+                return s, g, parent
+            closed.add(node)
+            self.expansions += 1
+            c = -negcost
+            for succ, step in successors(node, parent[node], g):
+                newcost = c + step
+                if succ not in closed and newcost < cost.get(succ, newcost + 1):
+                    cost[succ] = newcost
+                    parent[succ] = node
+                    heapq.heappush(heap, (newcost + self._heuristic(succ, g), -newcost, succ))
+        return s, g, None
+
+    def _path(self, s, g, parent):
+        if parent is None:
+            return []
+        # walk back from the goal, filling the straight lines between jump points
+        path = []
+        node = g
+        while node != s:
+            prev = parent[node]
+            d = node - prev
+            (x0, y0), (x1, y1) = self._xy(prev), self._xy(node)
+            n = max(abs(x1 - x0), abs(y1 - y0))
+            step = d // n
+            for k in range(n, 0, -1):
+                path.append(self._xy(prev + (k - 1)*step))
+            node = prev
+        path.reverse()
+        return path
+
+    def astar(self, start, goal):
+        free = self._free
+        steps = self._steps
+
+        def successors(node, parent, goal):
+            for d in steps:
+                if free[node + d]:
+                    yield node + d, 1
+
+        return self._path(*self._search(start, goal, successors))
+
+    def _straightJumps(self):
+        """
+        For every field and the 4 straight directions, the number of steps
+        to the next field where a straight jump stops: a wall or a field
+        with a forced neighbor (both are precomputed, as in JPS+)
+        """
+        stride = self._stride
+        free = np.array(self._free).reshape(-1, stride)
+        blocked = ~free
+        jumps = {}
+        for dx, dy in ((1,0), (-1,0), (0,1), (0,-1)):
+            # forced neighbors: a wall beside the field, but none diagonally ahead
+            if dx:
+                side = np.zeros_like(free)
+                side[1:-1, 1:-1] = ((blocked[1:-1, :-2] & np.roll(free, -dx, axis=0)[1:-1, :-2]) |
+                                    (blocked[1:-1, 2:] & np.roll(free, -dx, axis=0)[1:-1, 2:]))
+            else:
+                side = np.zeros_like(free)
+                side[1:-1, 1:-1] = ((blocked[:-2, 1:-1] & np.roll(free, -dy, axis=1)[:-2, 1:-1]) |
+                                    (blocked[2:, 1:-1] & np.roll(free, -dy, axis=1)[2:, 1:-1]))
+            stop = blocked | (side & free)
+            # scan against the direction; steps[f] = 1 if the next field stops
+            steps = np.ones(free.shape, dtype=np.int32)
+            if dx:
+                xs = range(free.shape[0] - 2, -1, -1) if dx > 0 else range(1, free.shape[0])
+                for x in xs:
+                    steps[x] = np.where(stop[x + dx], 1, steps[x + dx] + 1)
+            else:
+                ys = range(free.shape[1] - 2, -1, -1) if dy > 0 else range(1, free.shape[1])
+                for y in ys:
+                    steps[:, y] = np.where(stop[:, y + dy], 1, steps[:, y + dy] + 1)
+            jumps[dx*stride + dy] = steps.ravel().tolist()
+        return jumps
+
+    def jps(self, start, goal):
+        """
+        Jump point search: A* which only expands the fields where a
+        shortest path may have to turn
+        """
+        free = self._free
+        stride = self._stride
+        if not hasattr(self, "_jumps"):
+            self._jumps = self._straightJumps()
+        jumps = self._jumps
+
+        def direction(node, parent):
+            s = stride
+            dx = (node // s > parent // s) - (node // s < parent // s)
+            dy = (node % s > parent % s) - (node % s < parent % s)
+            return dx, dy
+
+        def prunedNeighbors(node, parent):
+            if parent is None:
+                return [ (dx, dy) for dx in (-1,0,1) for dy in (-1,0,1) if (dx,dy) != (0,0) ]
+            dx, dy = direction(node, parent)
+            dirs = []
+            if dx and dy:
+                dirs += [ (dx, 0), (0, dy), (dx, dy) ]
+                if not free[node - dx*stride] and free[node - dx*stride + dy]:
+                    dirs.append( (-dx, dy) )
+                if not free[node - dy] and free[node + dx*stride - dy]:
+                    dirs.append( (dx, -dy) )
+            elif dx:
+                dirs.append( (dx, 0) )
+                for e in (-1, 1):
+                    if not free[node + e] and free[node + dx*stride + e]:
+                        dirs.append( (dx, e) )
+            else:
+                dirs.append( (0, dy) )
+                for e in (-1, 1):
+                    if not free[node + e*stride] and free[node + e*stride + dy]:
+                        dirs.append( (e, dy) )
+            return dirs
+
+        def straightJump(node, d, goal):
+            n = jumps[d][node]
+            # the goal may lie between node and the stop
+            if d in (1, -1):
+                onLine = goal // stride == node // stride
+                k = (goal - node) * d
+            else:
+                onLine = goal % stride == node % stride
+                k = (goal - node) // d if onLine else 0
+            if onLine and 0 < k <= n:
+                return goal, k
+            node += n*d
+            return (node if free[node] else None), n
+
+        def jump(node, dx, dy, goal):
+            d = dx*stride + dy
+            if not (dx and dy):
+                return straightJump(node, d, goal)
+            n = 0
+            while True:
+                node += d
+                n += 1
+                if not free[node]:
+                    return None, n
+                if node == goal:
+                    return node, n
+                if ((not free[node - dx*stride] and free[node - dx*stride + dy]) or
+                    (not free[node - dy] and free[node + dx*stride - dy])):
+                    return node, n
+                if (straightJump(node, dx*stride, goal)[0] is not None
+                        or straightJump(node, dy, goal)[0] is not None):
+                    return node, n
+
+        def successors(node, parent, goal):
+            for dx, dy in prunedNeighbors(node, parent):
+                succ, n = jump(node, dx, dy, goal)
+                if succ is not None:
+                    yield succ, n
+
+        return self._path(*self._search(start, goal, successors))
@@ -0,0 +1,263 @@
+import asyncio
+import multiprocessing
+import sys
+import traceback
+
+
+class PlayerError(Exception):
+	"""
+	An exception raised by a player in its worker process
+	"""
+	def __init__(self, message, remote_traceback):
+		super().__init__(message)
+		self.remote_traceback = remote_traceback
+
+
+class PlayerDisabled(Exception):
+	"""
+	The player is not asked anymore: its worker was restarted after a
+	timeout or crash, and the player didn't get through reset again
+
+	@param first whether this is the call which disabled the player
+	"""
+	def __init__(self, message, first=True):
+		super().__init__(message)
+		self.first = first
+
+
+class WorkerDied(RuntimeError):
+	"""
+	The worker process of a player ended during a call
+	"""
+
+
+class PlayerHost(object):
+	"""
+	Call the methods of a player directly in the simulator process
+
+	Timeouts cannot be enforced for players hosted like this.
+	"""
+	def __init__(self, player):
+		self.player = player
+
+	def start(self):
+		pass
+
+	def stop(self):
+		pass
+
+	def call(self, method, *args, status=None, timeout=None):
+		result = getattr(self.player, method)(*args)
+		if method in ("move", "set_mines"):
+			result = list(result)
+		return result
+
+	async def call_async(self, method, *args, status=None, timeout=None):
+		"""
+		Like call, but awaitable; the player runs in a thread of the
+		event loop's executor, so other players can be served meanwhile
+		"""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(None, lambda: self.call(method, *args, status=status, timeout=timeout))
+
+
+def _serve(conn, player):
+	"""
+	Main loop of a player worker process
+
+	Receives (method, args, status) requests and answers with
+	(kind, result), where kind is one of "ok", "notimplemented"
+	and "error". A request None stops the worker.
+	"""
+	while True:
+		try:
+			request = conn.recv()
+		except EOFError:
+			break
+		if request is None:
+			break
+		method, args, status = request
+		if status is not None:
+			player.status = status
+		try:
+			result = getattr(player, method)(*args)
+			if method in ("move", "set_mines"):
+				result = list(result)
+			elif method == "reset":
+				# the simulator (and the illustrator) want to know the name
+				result = getattr(player, "player_name", None)
+			answer = ("ok", result)
+		except NotImplementedError as e:
+			answer = ("notimplemented", str(e))
+		except Exception as e:
+			answer = ("error", (str(e), traceback.format_exc()))
+		sys.stdout.flush()
+		conn.send(answer)
+
+
+class PlayerProcess(PlayerHost):
+	"""
+	Host a player in a long-lived worker process
+
+	The worker is spawned once and receives the player's public status with
+	every request over a pipe. If a request is not answered in time, the
+	worker is killed and restarted from the original player object (and
+	reset again), such that a hanging player cannot stall the game. A
+	player which doesn't get through that reset within resetTimeout is
+	disabled: its worker is stopped, and all further calls raise
+	PlayerDisabled at once.
+	"""
+	def __init__(self, player):
+		super().__init__(player)
+		self._process = None
+		self._conn = None
+		self._reset_args = None
+		# how often the worker was restarted (and the player lost its state)
+		self.restarts = 0
+		# seconds the reset of the player after a restart may take
+		self.resetTimeout = None
+		# why the player was disabled, None while it is enabled
+		self.disabled = None
+
+	def start(self):
+		# don't let the worker inherit (and later repeat) pending output
+		sys.stdout.flush()
+		conn, child_conn = multiprocessing.Pipe()
+		self._process = multiprocessing.Process(target=_serve, args=(child_conn, self.player),
+												daemon=True)
+		self._process.start()
+		child_conn.close()
+		self._conn = conn
+
+	def stop(self, kill=False):
+		if self._process is None:
+			return
+		if not kill:
+			try:
+				self._conn.send(None)
+			except (BrokenPipeError, OSError):
+				pass
+			self._process.join(timeout=1)
+		if self._process.is_alive():
+			self._process.terminate()
+			self._process.join(timeout=1)
+		if self._process.is_alive():
+			self._process.kill()
+			self._process.join()
+		self._conn.close()
+		self._process = None
+		self._conn = None
+
+	def restart(self):
+		"""
+		Replace the worker by a new one and reset the player in it again;
+		if the player doesn't answer that reset within resetTimeout either,
+		it is disabled (see PlayerDisabled)
+		"""
+		self.restarts += 1
+		self.stop(kill=True)
+		self.start()
+		if self._reset_args is not None:
+			try:
+				self._call_once("reset", self._reset_args, None, self.resetTimeout)
+			except Exception as e:
+				self.stop(kill=True)
+				self.disabled = "its reset after a restart failed (%s)" % (str(e) or type(e).__name__)
+
+	def _send(self, method, args, status):
+		if method == "reset":
+			self._reset_args = args
+		try:
+			self._conn.send((method, args, status))
+		except (BrokenPipeError, OSError):
+			# the worker died; _receive notices it
+			pass
+
+	def _receive(self, method):
+		try:
+			kind, result = self._conn.recv()
+		except (EOFError, OSError):
+			raise WorkerDied("player process died during '%s'" % method)
+
+		if kind == "notimplemented":
+			raise NotImplementedError(result)
+		if kind == "error":
+			raise PlayerError(*result)
+		if method == "reset" and result is not None:
+			self.player.player_name = result
+		return result
+
+	def _call_once(self, method, args, status, timeout):
+		"""
+		Call without restarting the worker if it fails
+
+		@raises TimeoutError, WorkerDied
+		"""
+		self._send(method, args, status)
+		self._wait(method, timeout)
+		return self._receive(method)
+
+	def _wait(self, method, timeout):
+		"""
+		Wait until the worker answered (or died)
+
+		@raises TimeoutError
+		"""
+		try:
+			answered = self._conn.poll(timeout)
+		except (EOFError, OSError):
+			answered = True
+		if not answered:
+			raise TimeoutError("no answer to '%s' after %gs" % (method, timeout))
+
+	def _check_enabled(self):
+		if self.disabled is not None:
+			raise PlayerDisabled(self.disabled, first=False)
+
+	def _failed(self, e):
+		"""
+		@returns the exception to raise after the worker was restarted
+		because of e
+		"""
+		if self.disabled is not None:
+			error = PlayerDisabled("%s; before that: %s" % (self.disabled, e))
+			error.__cause__ = e
+			return error
+		return e
+
+	def call(self, method, *args, status=None, timeout=None):
+		"""
+		Call a method of the hosted player
+
+		@param method name of the method
+		@param args arguments of the call
+		@param status public status to update in the worker before the call
+		@param timeout seconds to wait for the answer (None waits forever)
+		@returns the player's answer
+		@raises TimeoutError if the player did not answer in time
+		@raises PlayerDisabled if the player was disabled
+		"""
+		self._check_enabled()
+		try:
+			return self._call_once(method, args, status, timeout)
+		except (TimeoutError, WorkerDied) as e:
+			self.restart()
+			raise self._failed(e)
+
+	async def call_async(self, method, *args, status=None, timeout=None):
+		"""
+		Like call, but awaitable: waits for the answer of the worker (and
+		restarts it) in a thread of the event loop's executor, so the calls
+		to all players can run concurrently. (Not loop.add_reader, which
+		the default event loop on Windows doesn't implement.)
+		"""
+		self._check_enabled()
+		self._send(method, args, status)
+		loop = asyncio.get_running_loop()
+		try:
+			await loop.run_in_executor(None, self._wait, method, timeout)
+			return self._receive(method)
+		except (TimeoutError, WorkerDied) as e:
+			error = e
+		await loop.run_in_executor(None, self.restart)
+		raise self._failed(error)
@@ -0,0 +1,106 @@
+class PlayerIndex(object):
+	"""
+	The positions of the players, bucketed in a grid of square cells
+
+	Queries for the players in a rectangle or for the distance to the
+	nearest player only look at the players in the cells around the query,
+	instead of at all players.
+
+	@param width, height size of the map
+	@param cellsize side length of the cells; about the size of the
+	rectangles queried (e.g. the visibility window) works well
+	"""
+	def __init__(self, width, height, cellsize):
+		self.cellsize = max(1, int(cellsize))
+		self.width = width
+		self.height = height
+		self._positions = []
+		# (cx, cy) -> set of player ids
+		self._cells = {}
+
+	def copy(self):
+		index = PlayerIndex(self.width, self.height, self.cellsize)
+		index._positions = list(self._positions)
+		index._cells = { c: set(players) for c, players in self._cells.items() }
+		return index
+
+	def _cell(self, xy):
+		return (xy[0] // self.cellsize, xy[1] // self.cellsize)
+
+	def __len__(self):
+		return len(self._positions)
+
+	def add(self, xy):
+		"""
+		Add the next player (with id len(self)) at xy
+		"""
+		pId = len(self._positions)
+		self._positions.append(tuple(xy))
+		self._cells.setdefault(self._cell(xy), set()).add(pId)
+		return pId
+
+	def move(self, pId, xy):
+		old = self._cell(self._positions[pId])
+		new = self._cell(xy)
+		self._positions[pId] = tuple(xy)
+		if old != new:
+			players = self._cells[old]
+			players.discard(pId)
+			if not players:
+				del self._cells[old]
+			self._cells.setdefault(new, set()).add(pId)
+
+	def within(self, xl, yl, xu, yu):
+		"""
+		@returns the ids of the players in the rectangle [xl, xu] x [yl, yu],
+		in increasing order
+		"""
+		cxl, cyl = self._cell((xl, yl))
+		cxu, cyu = self._cell((xu, yu))
+		found = []
+		for cx in range(cxl, cxu + 1):
+			for cy in range(cyl, cyu + 1):
+				for pId in self._cells.get((cx, cy), ()):
+					x, y = self._positions[pId]
+					if xl <= x <= xu and yl <= y <= yu:
+						found.append(pId)
+		found.sort()
+		return found
+
+	def nearestDistance(self, xy):
+		"""
+		The (Chebyshev) distance from xy to the nearest player, None if
+		there are no players
+
+		The cells are searched in rings around the cell of xy; players in
+		ring k > 0 are at least (k-1)*cellsize + 1 away, so the search stops
+		as soon as the next ring can't have a nearer player.
+		"""
+		if not self._positions:
+			return None
+		cx, cy = self._cell(xy)
+		best = None
+		k = 0
+		# the ring beyond which there are no cells on the map
+		last = max(cx, cy, (self.width - 1) // self.cellsize - cx, (self.height - 1) // self.cellsize - cy)
+		while k <= last and (best is None or best > (k - 1)*self.cellsize + 1):
+			for ring in self._ring(cx, cy, k):
+				for pId in self._cells.get(ring, ()):
+					x, y = self._positions[pId]
+					d = max(abs(x - xy[0]), abs(y - xy[1]))
+					if best is None or d < best:
+						best = d
+			k += 1
+		return best
+
+	@staticmethod
+	def _ring(cx, cy, k):
+		if k == 0:
+			yield (cx, cy)
+			return
+		for i in range(-k, k + 1):
+			yield (cx + i, cy - k)
+			yield (cx + i, cy + k)
+		for i in range(-k + 1, k):
+			yield (cx - k, cy + i)
+			yield (cx + k, cy + i)
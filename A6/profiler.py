@@ -0,0 +1,83 @@
+import json
+
+import numpy as np
+
+# upper bounds (in seconds) of the histogram bins; the last bin is unbounded
+histogramBins = [ 1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 0.1, 0.3, 1.0, 3.0 ]
+
+
+def summarize(times):
+	"""
+	Statistics of a list of durations (in seconds)
+	"""
+	if len(times) == 0:
+		return { "count": 0 }
+	t = np.array(times)
+	p50, p90, p99 = np.percentile(t, [50, 90, 99])
+	counts = np.bincount(np.searchsorted(histogramBins, t), minlength=len(histogramBins) + 1)
+	return {
+		"count": len(times),
+		"total": float(t.sum()),
+		"mean": float(t.mean()),
+		"p50": float(p50),
+		"p90": float(p90),
+		"p99": float(p99),
+		"max": float(t.max()),
+		"histogram": counts.tolist(),
+	}
+
+
+class Profiler(object):
+	"""
+	Wall time of the phases of every round and of the calls of the players
+
+	Usage: sim.profiler = Profiler("profile.json") before sim.play(...);
+	the JSON report is written at the end of the game. Without a profiler
+	(the default), the simulator doesn't measure anything.
+
+	@param filename where to write the report, None to only collect it
+	"""
+	def __init__(self, filename=None):
+		self.filename = filename
+		# phase -> list of (round, seconds)
+		self.phases = {}
+		# (player, method) -> list of seconds
+		self.calls = {}
+
+	def record_phase(self, name, r, seconds):
+		self.phases.setdefault(name, []).append( (r, seconds) )
+
+	def record_call(self, pId, method, seconds):
+		self.calls.setdefault( (pId, method), [] ).append(seconds)
+
+	def report(self, sim=None, slowest=10):
+		"""
+		@param sim the simulator, for the names of the players
+		@param slowest number of slowest rounds to list
+		"""
+		rounds = {}
+		for name, times in self.phases.items():
+			for r, seconds in times:
+				rounds[r] = rounds.get(r, 0.0) + seconds
+		names = {}
+		if sim is not None:
+			names = { pId: getattr(p, "player_name", None) for pId, p in enumerate(sim._players) }
+
+		players = {}
+		for (pId, method), times in sorted(self.calls.items()):
+			player = players.setdefault(str(pId), { "name": names.get(pId) })
+			player[method] = summarize(times)
+
+		return {
+			"histogramBins": histogramBins,
+			"rounds": len(rounds),
+			"round": summarize(list(rounds.values())),
+			"phases": { name: summarize([ s for r, s in times ]) for name, times in self.phases.items() },
+			"slowestRounds": [ { "round": r, "seconds": s }
+				for r, s in sorted(rounds.items(), key=lambda rs: -rs[1])[:slowest] ],
+			"players": players,
+		}
+
+	def write(self, sim=None):
+		with open(self.filename, "w") as fh:
+			json.dump(self.report(sim), fh, indent=1)
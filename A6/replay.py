@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import pickle
+import struct
+import zlib
+
+from game_utils import Direction, Map
+from player_base import Player
+from player_host import PlayerHost
+from simulator import Simulator
+from events import NullSink, TextSink
+
+# Replay files consist of frames, each a little endian 8 byte length
+# followed by a zlib compressed pickle:
+#   header:  seed, map, parameters and player names
+#   chunks:  state at the begin of round 'first' (a checkpoint), and the
+#            answers of all players in rounds first, first+1, ...
+#   index:   first round and file offset of every chunk
+# The file ends with the 8 byte offset of the index frame.
+_magic = b"RobotRaceReplay1"
+_length = struct.Struct("<Q")
+
+
+def _write_frame(fh, obj):
+	data = zlib.compress(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+	offset = fh.tell()
+	fh.write(_length.pack(len(data)))
+	fh.write(data)
+	return offset
+
+
+def _read_frame(fh, offset):
+	fh.seek(offset)
+	(length,) = _length.unpack(fh.read(_length.size))
+	return pickle.loads(zlib.decompress(fh.read(length)))
+
+
+def _encode_moves(moves):
+	return bytes(m.value for m in moves)
+
+
+def _decode_moves(data):
+	return [ Direction(v) for v in data ]
+
+
+class Recorder(object):
+	"""
+	Record a game for replaying it without the players
+
+	Records the seed, map, parameters and the (validated) answers of all
+	players in every round, plus a checkpoint of the complete game state
+	every 'interval' rounds.
+
+	Usage: sim.recorder = Recorder(filename) before sim.play(...)
+	"""
+	def __init__(self, filename, interval=200):
+		self.filename = filename
+		self.interval = interval
+		self._fh = None
+
+	def begin(self, sim, rounds):
+		self._fh = open(self.filename, "wb")
+		self._fh.write(_magic)
+		_write_frame(self._fh, {
+			"seed": sim.seed,
+			"width": sim.map.width,
+			"height": sim.map.height,
+			"map": sim.map._status.copy(),
+			"params": sim.params,
+			"rounds": rounds,
+			"players": [ getattr(p, "player_name", None) for p in sim._players ],
+			"interval": self.interval,
+		})
+		self._numPlayers = len(sim._players)
+		self._chunks = []  # (first round, offset)
+		self._chunk = None
+
+	def begin_round(self, sim, r):
+		if self._chunk is None or len(self._chunk["rounds"]) >= self.interval:
+			self._write_chunk()
+			self._chunk = { "first": r, "state": sim._get_state(), "rounds": [] }
+		# mines and moves of every player
+		self._chunk["rounds"].append( ([ [] for i in range(self._numPlayers) ],
+									[ b"" for i in range(self._numPlayers) ]) )
+
+	def record_mines(self, pId, mines):
+		self._chunk["rounds"][-1][0][pId] = [ (int(x), int(y)) for x, y in mines ]
+
+	def record_moves(self, movesPerPlayer):
+		self._chunk["rounds"][-1][1][:] = [ _encode_moves(moves) for moves in movesPerPlayer ]
+
+	def _write_chunk(self):
+		if self._chunk is not None:
+			offset = _write_frame(self._fh, self._chunk)
+			self._chunks.append( (self._chunk["first"], offset) )
+			self._chunk = None
+
+	def end(self):
+		self._write_chunk()
+		offset = _write_frame(self._fh, { "chunks": self._chunks })
+		self._fh.write(_length.pack(offset))
+		self._fh.close()
+		self._fh = None
+
+
+class ReplayPlayer(Player):
+	"""
+	Answers with the recorded mines and moves of a player
+	"""
+	def __init__(self, replay, pId, name):
+		self._replay = replay
+		self._pId = pId
+		self.player_name = name
+
+	def reset(self, player_id, max_players, width, height):
+		pass
+
+	def round_begin(self, r):
+		pass
+
+	def set_mines(self, status):
+		return self._replay._answers[0][self._pId]
+
+	def move(self, status):
+		return _decode_moves(self._replay._answers[1][self._pId])
+
+
+class Replay(object):
+	"""
+	Re-simulate a recorded game without loading the players
+
+	The game is re-simulated from the nearest checkpoint, so any round of
+	a long game can be reached quickly.
+	"""
+	def __init__(self, filename):
+		self.filename = filename
+		with open(filename, "rb") as fh:
+			if fh.read(len(_magic)) != _magic:
+				raise ValueError("%s is not a replay file." % filename)
+			self.header = _read_frame(fh, len(_magic))
+			fh.seek(-_length.size, 2)
+			(offset,) = _length.unpack(fh.read(_length.size))
+			self._chunks = _read_frame(fh, offset)["chunks"]
+		self._chunkFirst = [ first for first, offset in self._chunks ]
+		self.rounds = self.header["rounds"]
+		self._answers = None
+
+	def _chunk(self, i):
+		with open(self.filename, "rb") as fh:
+			return _read_frame(fh, self._chunks[i][1])
+
+	def simulator(self, events=None):
+		"""
+		Return a simulator with the replay players, in the state before round 1
+		"""
+		m = Map(self.header["width"], self.header["height"])
+		m._status[:] = self.header["map"]
+		sim = Simulator(map=m, seed=self.header["seed"])
+		sim.params = self.header["params"]
+		sim.events = NullSink() if events is None else events
+		sim.usePlayerProcesses = False
+		for pId, name in enumerate(self.header["players"]):
+			sim.add_player(ReplayPlayer(self, pId, name))
+		for pub in sim._pubStat:
+			pub.params.rounds = self.rounds
+		sim._hosts = [ PlayerHost(p) for p in sim._players ]
+		sim._set_state(self._chunk(0)["state"])
+		return sim
+
+	def seek(self, sim, r):
+		"""
+		Bring the simulator of this replay into the state after round r
+		"""
+		assert 0 <= r <= self.rounds
+		i = max(bisect.bisect_right(self._chunkFirst, r + 1) - 1, 0)
+		if not (self._chunkFirst[i] - 1 <= sim.round <= r):
+			# start from the checkpoint instead of the current state
+			chunk = self._chunk(i)
+			sim._set_state(chunk["state"])
+		self.play(sim, r)
+		return sim
+
+	def play(self, sim, until):
+		"""
+		Re-simulate the rounds after sim.round up to round 'until'
+		"""
+		chunk = None
+		for r in range(sim.round + 1, until + 1):
+			if chunk is None or r >= chunk["first"] + len(chunk["rounds"]):
+				i = bisect.bisect_right(self._chunkFirst, r) - 1
+				chunk = self._chunk(i)
+			self._answers = chunk["rounds"][r - chunk["first"]]
+			sim._play_round(r)
+		return sim
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Replay a recorded Robot Race")
+	parser.add_argument('replay', help="the replay file (see runRobotRace.py --record)", type=str)
+	parser.add_argument('--round', help="show the board after this round", type=int, default=None)
+	parser.add_argument('--play', help="show all events of this many rounds after --round", type=int, default=0)
+	args = parser.parse_args()
+
+	replay = Replay(args.replay)
+	r = replay.rounds if args.round is None else args.round
+	sim = replay.seek(replay.simulator(), r)
+	print("Board after round %d:" % r)
+	print(sim)
+	if args.play > 0:
+		sim.events = TextSink()
+		replay.play(sim, min(r + args.play, replay.rounds))
+		sim.events.flush()
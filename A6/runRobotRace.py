@@ -8,31 +8,63 @@ from game_utils import Tile, TileStatus, TileObject
 from game_utils import Map, Status
 from simulator import Simulator
 from player_base import Player
+from events import JsonLinesSink, NullSink, levelNames
+from replay import Recorder
+from profiler import Profiler
 
 parser = argparse.ArgumentParser(description="Robot Race Simulator 7000")
 parser.add_argument('--viz', help="filename for the visualization of the race", type=str)
 parser.add_argument('--number', help="number of rounds", type=int, default=1000)
 parser.add_argument('--density', help="map density", type=float, default=0.4)
+parser.add_argument('--viz-stream', help="write the data of the visualization to this directory while playing;"
+					" render it later with illustrator.py", type=str, default=None)
 parser.add_argument('--framerate', help="specify framerate of the visualization", type=int, default=8)
 parser.add_argument('--map', help="specify map file", type=str,default=None)
+parser.add_argument('--log', help="write the events of the game as JSON lines to this file instead of printing them", type=str, default=None)
+parser.add_argument('--log-level', help="minimum level of logged events", type=str, default="info",
+					choices=[ name for name in levelNames.values() if name != "silent" ])
+parser.add_argument('--quiet', help="don't report any events", action='store_true')
+parser.add_argument('--profile', help="write the time spent in the phases of the rounds and by the players"
+					" as JSON to this file", type=str, default=None)
+parser.add_argument('--delta-observations', help="give the robots only the changes of the map since the"
+					" previous round, besides the map (see Status.delta)", action='store_true')
+parser.add_argument('--record', help="record the game to this replay file (see replay.py)", type=str, default=None)
 
-args = parser.parse_args()
+# the game is only played when run as script, not when the module is
+# imported again, e.g. by worker processes started by spawning
+if __name__ == "__main__":
+	args = parser.parse_args()
 
-robot_module_names = {"Test":"test-RobotRace",
-					"Beatme": "beatme-RobotRace"}
+	robot_module_names = {"Test":"test-RobotRace",
+						"Beatme": "beatme-RobotRace"}
 
-robotmodules = { m:__import__(m) for m in robot_module_names.values() }
+	robotmodules = { m:__import__(m) for m in robot_module_names.values() }
 
-if args.map is not None:
-   m = Map.read(args.map)
-else:
-   m = Map.makeRandom(30, 30, args.density)
+	if args.map is not None:
+		m = Map.read(args.map)
+	else:
+		m = Map.makeRandom(30, 30, args.density)
 
-sim = Simulator(map=m, vizfile=args.viz, framerate=args.framerate)
+	sim = Simulator(map=m, vizfile=args.viz, framerate=args.framerate, vizdir=args.viz_stream)
+	level = { name: level for level, name in levelNames.items() }[args.log_level]
+	if args.quiet:
+		sim.events = NullSink()
+	elif args.log is not None:
+		sim.events = JsonLinesSink(args.log, level=level)
+	else:
+		sim.events.level = level
 
-for name,module_name in robot_module_names.items():
-	for p in robotmodules[module_name].players:
-		p.player_modname = name
-		sim.add_player(p)
+	for name,module_name in robot_module_names.items():
+		for p in robotmodules[module_name].players:
+			p.player_modname = name
+			sim.add_player(p)
 
-sim.play(rounds=args.number)
+	sim.deltaObservations = args.delta_observations
+
+	if args.record is not None:
+		sim.recorder = Recorder(args.record)
+	if args.profile is not None:
+		sim.profiler = Profiler(args.profile)
+
+	sim.play(rounds=args.number)
+	sim.events.close()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import importlib
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from game_utils import Map
+from simulator import Simulator
+from events import NullSink
+
+parser = argparse.ArgumentParser(description="Robot Race Tournament: play many headless games in parallel")
+parser.add_argument('maps', help="map files to play on (e.g. Maps/*.dat)", type=str, nargs='+')
+parser.add_argument('--seeds', help="seeds to play on every map", type=int, nargs='+', default=None)
+parser.add_argument('--games', help="number of seeds per map (if --seeds is not given)", type=int, default=10)
+parser.add_argument('--number', help="number of rounds per game", type=int, default=1000)
+parser.add_argument('--workers', help="number of worker processes (default: number of cores)", type=int,
+					default=os.cpu_count())
+parser.add_argument('--robots', help="robot modules as NAME=MODULE", type=str, nargs='+',
+					default=["Test=test-RobotRace", "Beatme=beatme-RobotRace"])
+parser.add_argument('--confidence', help="level of the confidence intervals", type=float, default=0.95)
+
+
+def play_game(mapfile, seed, rounds, robots):
+	"""
+	Play a single game without any output
+
+	@param mapfile the map file to play on
+	@param seed the seed of the simulator (also used for the players' random module)
+	@param rounds number of rounds
+	@param robots list of (name, module name) pairs
+	@returns list of (name, player name, gold, health) per player
+	"""
+	random.seed(seed)
+	with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+		sim = Simulator(map=Map.read(mapfile), seed=seed)
+		sim.events = NullSink()
+
+		for name, module_name in robots:
+			# reload to get fresh player objects for every game
+			module = importlib.reload(importlib.import_module(module_name))
+			for p in module.players:
+				p.player_modname = name
+				sim.add_player(p)
+
+		sim.play(rounds=rounds)
+
+	return [ (p.player_modname, p.player_name, s.gold, s.health)
+			for p, s in zip(sim._players, sim._status) ]
+
+
+def confidence_interval(values, confidence):
+	"""
+	Mean and half width of the confidence interval of the mean
+
+	Uses the normal approximation, i.e. assumes a reasonable number of games.
+	"""
+	mean = statistics.mean(values)
+	if len(values) < 2:
+		return mean, float("nan")
+	z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+	return mean, z * statistics.stdev(values) / math.sqrt(len(values))
+
+
+def summary(results, confidence):
+	# (name, player name) -> lists of final gold and health
+	gold = {}
+	health = {}
+	for game in results:
+		for name, player_name, g, h in game:
+			key = (name, player_name)
+			gold.setdefault(key, []).append(g)
+			health.setdefault(key, []).append(h)
+
+	s = "Player                        Games   Gold                 Health\n"
+	for key in sorted(gold, key=lambda k: -statistics.mean(gold[k])):
+		gmean, gci = confidence_interval(gold[key], confidence)
+		hmean, hci = confidence_interval(health[key], confidence)
+		s += "{:<30}{:<8}{:>9.1f} +- {:<8.1f}{:>7.1f} +- {:<6.1f}\n".format(
+			"%s/%s" % key, len(gold[key]), gmean, gci, hmean, hci)
+	return s
+
+
+if __name__ == "__main__":
+	args = parser.parse_args()
+
+	robots = [ tuple(r.split("=", 1)) for r in args.robots ]
+	seeds = args.seeds if args.seeds is not None else list(range(args.games))
+	jobs = [ (mapfile, seed) for mapfile in args.maps for seed in seeds ]
+
+	startTime = time.time()
+	results = []
+	with ProcessPoolExecutor(max_workers=args.workers) as executor:
+		futures = { executor.submit(play_game, mapfile, seed, args.number, robots): (mapfile, seed)
+					for mapfile, seed in jobs }
+		for future in as_completed(futures):
+			mapfile, seed = futures[future]
+			try:
+				results.append(future.result())
+			except Exception as e:
+				print("ERROR: game on %s with seed %d failed: %s" % (mapfile, seed, str(e)), file=sys.stderr)
+				traceback.print_exc()
+			print("Finished %d/%d games" % (len(results), len(jobs)), file=sys.stderr)
+
+	print("Played %d games of %d rounds on %d workers in %.1fs" %
+		(len(results), args.number, args.workers, time.time() - startTime))
+	print("Mean final values with %d%% confidence intervals:" % round(100 * args.confidence))
+	print(summary(results, args.confidence))
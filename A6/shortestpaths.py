@@ -1,34 +1,176 @@
 #!/usr/bin/env python3
-from collections import deque
+from collections import OrderedDict
 import copy
 from game_utils import Direction as D, MoveStatus
 from game_utils import Tile, TileStatus, TileObject
 import random
+import threading
 
 import numpy as np
 
+# neighbor offsets (dx,dy) of the 8-connected grid
+_neighborOffsets = [(dx,dy) for dx in (-1,0,1) for dy in (-1,0,1) if (dx,dy) != (0,0)]
+
+# neighbor offsets in the order in which shortestPathFrom looks for the next field
+_pathOffsets = [(0,-1), (0,1), (-1,0), (-1,-1), (-1,1), (1,0), (1,-1), (1,1)]
+_directionOfOffset = { d.as_xy(): d for d in D }
+_directions = list(D)
+_directionOffsets = [ d.as_xy() for d in _directions ]
+
+def nextHops(dist):
+    """
+    The direction of the next move towards the sink for every field
+
+    The next field is the one shortestPathFrom would choose.
+
+    @param dist distances to the sink as returned by wavefrontDistances
+    @returns int8 array indexed [x,y] with the Direction values; -1 for
+    the sink and fields which can't reach it
+    """
+    width, height = dist.shape
+    padded = np.full((width + 2, height + 2), -1, dtype=dist.dtype)
+    padded[1:-1, 1:-1] = dist
+    hops = np.full(dist.shape, -1, dtype=np.int8)
+    # the first matching neighbor wins, so assign in reverse order
+    for dx, dy in reversed(_pathOffsets):
+        neighbor = padded[1+dx:width+1+dx, 1+dy:height+1+dy]
+        hops[(dist > 0) & (neighbor == dist - 1)] = _directionOfOffset[dx, dy].value
+    return hops
+
+def wavefrontDistances(wallmap, sink):
+    """
+    Distances of all fields to the sink by breadth first search
+
+    The frontier of the search is expanded as a whole in every step; with
+    the map padded by walls, the neighbors of all frontier fields are
+    found by adding the offsets of the 8 directions to their flat indices.
+
+    @param wallmap boolean array indexed [x,y]; True for walls
+    @param sink (x,y) of the start of the search
+    @returns int array indexed [x,y] with the distance of every field
+    to the sink; -1 for unreachable fields
+    """
+    width, height = wallmap.shape
+    stride = height + 2
+    # fields which are neither walls nor visited yet
+    free = np.zeros((width + 2, stride), dtype=bool)
+    free[1:-1, 1:-1] = ~wallmap
+    free = free.ravel()
+    offsets = np.array([dx*stride + dy for dx, dy in _neighborOffsets])
+
+    dist = np.full(free.shape, -1, dtype='int')
+    stamp = np.zeros(free.shape, dtype=np.intp)
+
+    frontier = np.array([(sink[0] + 1)*stride + sink[1] + 1])
+    free[frontier] = False
+    d = 0
+    while frontier.size:
+        dist[frontier] = d
+        d += 1
+        neighbors = (frontier[:, None] + offsets).ravel()
+        neighbors = neighbors[free[neighbors]]
+        # remove duplicates: keep the neighbors which won the stamp
+        order = np.arange(neighbors.size)
+        stamp[neighbors] = order
+        neighbors = neighbors[stamp[neighbors] == order]
+        free[neighbors] = False
+        frontier = neighbors
+
+    return dist.reshape(width + 2, stride)[1:-1, 1:-1].copy()
+
+class DistanceCache:
+    """
+    Least recently used cache of distance fields
+
+    The fields are keyed by the sink and the walls of the map, so a field
+    is reused as long as the sink does not move and no wall is discovered.
+    The cached fields are read-only. The cache is shared by all threads of
+    a process (see distanceCache).
+
+    @param maxsize maximal number of cached fields
+    """
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fields = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(sink, wallmap):
+        return (tuple(sink), wallmap.shape, np.packbits(wallmap).tobytes())
+
+    def get(self, key):
+        with self._lock:
+            dist = self._fields.get(key)
+            if dist is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._fields.move_to_end(key)
+            return dist
+
+    def put(self, key, dist):
+        dist.flags.writeable = False
+        with self._lock:
+            self._fields[key] = dist
+            self._fields.move_to_end(key)
+            while len(self._fields) > self.maxsize:
+                self._fields.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._fields.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __str__(self):
+        return "DistanceCache: %d fields, %d hits, %d misses" % (len(self), self.hits, self.misses)
+
+# the cache used by AllShortestPaths by default
+distanceCache = DistanceCache()
+
 class AllShortestPaths:
-    def __init__(self,sink,map):
+    """
+    Shortest paths of all fields to the sink
+
+    @param sink (x,y) of the target
+    @param map the map; only walls are obstacles
+    @param cache DistanceCache for the distance field, None to always
+    calculate it
+    @param directions whether to calculate the field nextHop of the
+    directions towards the sink; then paths are found by lookups
+    """
+    def __init__(self,sink,map,cache=distanceCache,directions=False):
         self.sink = sink
         self.map = map
 
         self.width=map.width
         self.height=map.height
 
-        # self.wallmap = np.zeros((self.height, self.width), dtype='bool')
+        # indexed [x,y]
+        self.wallmap = map.statusMask(TileStatus.Wall).T
 
-        # for x in range(self.width):
-        #     for y in range(self.height):
-        #         self.wallmap[x,y] = self.map[x,y].status == TileStatus.Wall
+        if cache is None:
+            self._calcDistances()
+        else:
+            key = cache.key(sink, self.wallmap)
+            self.dist = cache.get(key)
+            if self.dist is None:
+                self._calcDistances()
+                cache.put(key, self.dist)
 
-        wm = [ [ self.map[x,y].status == TileStatus.Wall for y in range(self.height) ]
-               for x in range(self.width) ]
-
-        self.wallmap = np.array(wm,dtype='bool')
-
-        self.dist = np.negative(np.ones((self.height, self.width), dtype='int'))
-
-        self._calcDistances()
+        self.nextHop = None
+        if directions:
+            if cache is None:
+                self.nextHop = nextHops(self.dist)
+            else:
+                self.nextHop = cache.get((key, "nextHop"))
+                if self.nextHop is None:
+                    self.nextHop = nextHops(self.dist)
+                    cache.put((key, "nextHop"), self.nextHop)
 
     # return the non-Wall neighbors of a field (x,y)
     def nonWallNeighborsIter(self,xy):
@@ -49,23 +191,38 @@ class AllShortestPaths:
                     yield (x,y)
 
     def _calcDistances(self):
-        front = deque()
-        front.append(self.sink)
-
         assert type(self.sink) == tuple
-        self.dist[self.sink] = 0
+        # indexed [x,y]
+        self.dist = wavefrontDistances(self.wallmap, self.sink)
 
-        while front:
-            xy=front.popleft()
-            for neighbor in self.nonWallNeighborsIter(xy):
-                if self.dist[neighbor]<0:
-                    front.append(neighbor)
-                    self.dist[neighbor] = self.dist[xy] + 1
+    def directionsFrom(self, xy):
+        """
+        The moves along the shortest path from xy to the sink (needs
+        directions=True); [] if xy is the sink or can't reach it
+        """
+        moves = []
+        (x,y) = xy
+        hop = self.nextHop[x,y]
+        while hop >= 0:
+            moves.append(_directions[hop])
+            dx, dy = _directionOffsets[hop]
+            x += dx
+            y += dy
+            hop = self.nextHop[x,y]
+        return moves
 
     def shortestPathFrom(self, xy):
         if self.dist[xy]<0:
             return []
 
+        if self.nextHop is not None and xy != self.sink:
+            path = [xy]
+            for d in self.directionsFrom(xy)[:-1]:
+                dx, dy = d.as_xy()
+                xy = (xy[0] + dx, xy[1] + dy)
+                path.append(xy)
+            return path
+
         path = list()
         curdist = self.dist[xy]
 
@@ -1,124 +1,315 @@
+import asyncio
+import concurrent.futures
 import copy
+import math
 import random
 import sys
 import traceback
-import multiprocessing
-import threading
-import queue
 import time
 
+import numpy as np
+
 from game_utils import nameFromPlayerId
-from game_utils import Direction, MoveStatus
-from game_utils import Tile, TileStatus, TileObject
-from game_utils import Map, Status, GameParameters
+from game_utils import Direction
+from game_utils import TileStatus, TileObject
+from game_utils import MapWindow, MapDelta, Status, OtherPlayer, GameParameters
 
 from illustrator import Illustrator
+from player_host import PlayerHost, PlayerProcess, PlayerError, PlayerDisabled
+from move_engine import MoveEngine
+from freecells import FreeCellPool
+from playerindex import PlayerIndex
+from events import Event, TextSink, NullSink, INFO, WARNING, ERROR
+
+def _copy(obj):
+	"""
+	Shallow copy of a plain object (faster than copy.copy)
+	"""
+	new = object.__new__(type(obj))
+	new.__dict__.update(obj.__dict__)
+	return new
+
 
 class Simulator(object):
-	def __init__(self, *, map, seed=None, vizfile=None, framerate):
+	def __init__(self, *, map, seed=None, vizfile=None, framerate=8, vizdir=None):
 		self.rng = random.Random()
 		if seed is None:
 			seed = random.randrange(sys.maxsize)
 		self.rng.seed(seed)
 		self.seed = seed
 		self.map = map = copy.deepcopy(map)
-		for x in range(map.width):
-			for y in range(map.height):
-				if map[x, y].status == TileStatus.Unknown:
-					raise ValueError("Tile (%d, %d) is unkown." % (x, y))
-				map[x, y].obj = None
-
+		unknown = np.argwhere(map.statusMask(TileStatus.Unknown).T)
+		if len(unknown) > 0:
+			raise ValueError("Tile (%d, %d) is unkown." % tuple(unknown[0]))
+		map.clearObjects()
+		# the tiles where players and gold pots can be placed
+		self._freeCells = FreeCellPool(map)
+
+		# where events of the game go (see events.py), and which
+		# ones are reported
+		self.events = TextSink()
 		self.printInitial = True
 		self.printRoundBegin = True
 		self.printEvents = True
 		self.printMoves = True
+		self.printFinal = True
 		self._debugMoves = False
 		self._debugPlayerCrash = False
+		# optional replay.Recorder, which records the game
+		self.recorder = None
+		# optional profiler.Profiler, which measures the phases and players
+		self.profiler = None
+		# host every player in its own worker process, which allows to
+		# enforce the timeouts
+		self.usePlayerProcesses = True
+		# event loop in which the players are asked for their decisions
+		self._loop = None
+		# answers of the players given to step, instead of asking them
+		self._actions = None
+		self.maxThreads = 64
+		# besides the map, give the players the changes of the map since
+		# their previous observation (Status.delta), so they can keep their
+		# own maps up to date in time proportional to the visible tiles
+		self.deltaObservations = False
 
 		self.params = GameParameters()
+		# the positions of the players, for visibility and distance queries
+		self._playerIndex = PlayerIndex(map.width, map.height, 2*self.params.visibility + 1)
 
 		self._players = []
+		self._hosts = []
+		# the internal data, without map
+		self._status = status = []
+		# the object we give the player each time, updated from the internal data
+		self._pubStat = pubStat = []  
+		# the previous observation of every player, for deltaObservations:
+		# (map window, restarts of its host) or None
+		self._observed = []
+
 		self._goldPots = goldPots = {}  # (x, y) -> int
 		for i in range(self.params.maxNumGoldPots):
 			self._add_gold_pot()
 
 		self.goldPotRemainingRounds = self.params.goldPotTimeOut
+		self.round = 0
 
 		# keep a dictionary of the mines
 		# (x, y) -> expiry_round -- the round in which the mine should expire
 		self._mines = {}  
+		# and the mines by expiry round: expiry_round -> list of (x, y)
+		self._mineExpiry = {}
 
-		# the internal data, without map
-		self._status = status = []
-		# the object we give the player each time, updated from the internal data
-		self._pubStat = pubStat = []  
-
-		self.illustrator = Illustrator(self.map, vizfile, framerate)
+		self.illustrator = Illustrator(self.map, vizfile, framerate, streamdir=vizdir)
 
 	def _random_empty_spot(self):
-		while True:
-			x = self.rng.randint(0, self.map.width - 1)
-			y = self.rng.randint(0, self.map.height - 1)
-			if self.map[x, y].status != TileStatus.Empty:
-				continue
-			if self.map[x, y].obj is not None:
-				continue
-			break
-		return (x,y)
+		return self._freeCells.sample(self.rng)
 
 	def add_player(self, p):
 		pId = len(self._players)
 		self._players.append(p)
 		(x,y) = self._random_empty_spot()
 		self.map[x, y].obj = TileObject.makePlayer(pId)
+		self._freeCells.discard((x,y))
+		self._playerIndex.add((x,y))
 		self._status.append(Status(pId, x=x , y=y, health=self.params.maxHealth,
 							gold=self.params.initialGoldPerPlayer))
 		self._pubStat.append(Status(pId, x=x, y=y, health=self.params.maxHealth,
 							gold=self.params.initialGoldPerPlayer, params=self.params))
+		self._observed.append(None)
 
 		# duplicate the public status object in the player object
 		p.status = self._pubStat[-1]
 
 	def play(self, *, rounds):
 		rounds = int(rounds)
+		hostClass = PlayerProcess if self.usePlayerProcesses else PlayerHost
+		self._hosts = [ hostClass(p) for p in self._players ]
+		for host in self._hosts:
+			host.resetTimeout = getattr(self.params, "resetTimeout", None)
+		try:
+			self._play(rounds)
+		finally:
+			for host in self._hosts:
+				host.stop()
+			self._close_loop()
+
+	def _play(self, rounds):
 		for pId in range(len(self._players)):
 			# to avoid breaking the player interface,
 			# set number of rounds in the players status objects
 			self._pubStat[pId].params.rounds=rounds
 
-			self._players[pId].reset(pId, len(self._players), self.map.width, self.map.height)
+			self._hosts[pId].start()
+			self._hosts[pId].call("reset", pId, len(self._players), self.map.width, self.map.height,
+				status=self._pubStat[pId])
 
 		self.illustrator._add_robots(self._players)
-		self.illustrator._add_nrounds(rounds)
 
-		if self.printInitial:
-			print("Initial board:")
-			print(self)
+		if self.printInitial and self.events.enabled(INFO):
+			self._log("board", title="Initial board:", separator="", board=str(self))
 
+		if self.recorder is not None:
+			self.recorder.begin(self, rounds)
 		for r in range(1, rounds + 1):
-			self._begin_round(r)
-			self._handle_shooting(r)
-			self._handle_setting_mines(r)
-			self._handle_moving(r)
-			self._handle_healing(r)
-			# TODO: something to do at the end of the round?
-			self.illustrator.append_goldpots(self._goldPots)
-			self.illustrator.append_robots(self._players)
-			self.illustrator.append_mines(getattr(self,'_mines',{}))
-
-		print("=" * 80)
-		print("Final board:")
-		print(self)
+			self._play_round(r)
+		if self.recorder is not None:
+			self.recorder.end()
+
+		if self.printFinal and self.events.enabled(INFO):
+			self._log("board", title="Final board:", separator="=" * 80 + "\n", board=str(self))
+		self.events.flush()
+		if self.profiler is not None and self.profiler.filename is not None:
+			self.profiler.write(self)
+		self.illustrator.finish()
 		if self.illustrator.vizfile:
 			self.illustrator._illustrate()
 
 
+	def _play_round(self, r):
+		if self.recorder is not None:
+			self.recorder.begin_round(self, r)
+		self.round = r
+		profiler = self.profiler
+		for name, phase in ( ("begin_round", self._begin_round), ("shooting", self._handle_shooting),
+							("setting_mines", self._handle_setting_mines), ("moving", self._handle_moving),
+							("healing", self._handle_healing) ):
+			if profiler is None:
+				phase(r)
+			else:
+				startTime = time.perf_counter()
+				phase(r)
+				profiler.record_phase(name, r, time.perf_counter() - startTime)
+		# TODO: something to do at the end of the round?
+		self.illustrator.append_goldpots(self._goldPots)
+		self.illustrator.append_robots(self._players)
+		self.illustrator.append_mines(getattr(self,'_mines',{}))
+		self.events.flush()
+
+	def _get_state(self):
+		"""
+		Return a copy of the complete state of the game (without the players)
+		"""
+		return {
+			"round": self.round,
+			"status": self.map._status.copy(),
+			"objects": self.map._objects.copy(),
+			"players": [ (s.x, s.y, s.health, s.gold) for s in self._status ],
+			"goldPots": dict(self._goldPots),
+			"goldPotRemainingRounds": self.goldPotRemainingRounds,
+			"mines": dict(self._mines),
+			"rng": self.rng.getstate(),
+			"freeCells": self._freeCells.getstate(),
+		}
+
+	def _set_state(self, state):
+		"""
+		Restore a state returned by _get_state
+		"""
+		assert len(state["players"]) == len(self._status)
+		self.round = state["round"]
+		self.map._status[:] = state["status"]
+		self.map._objects[:] = state["objects"]
+		for s, (x, y, health, gold) in zip(self._status, state["players"]):
+			s.x, s.y, s.health, s.gold = x, y, health, gold
+			self._playerIndex.move(s.player, (x, y))
+		self._goldPots = dict(state["goldPots"])
+		self.goldPotRemainingRounds = state["goldPotRemainingRounds"]
+		self._mines = dict(state["mines"])
+		self._mineExpiry = {}
+		for xy, expirydate in self._mines.items():
+			self._mineExpiry.setdefault(expirydate, []).append(xy)
+		self.rng.setstate(state["rng"])
+		self._freeCells.setstate(state["freeCells"])
+		# the players get the complete window again
+		self._observed = [ None for s in self._status ]
+
+	def snapshot(self):
+		"""
+		Save the state of the game between two rounds (without the players,
+		which keep their own state)
+
+		@returns an object for restore; it only holds copies of arrays and
+		small containers, so it is cheap to make and can be pickled
+		"""
+		return self._get_state()
+
+	def restore(self, snapshot):
+		"""
+		Bring the game back into the state saved by snapshot
+		"""
+		self._set_state(snapshot)
+
+	def fork(self, events=None):
+		"""
+		Branch the game: a new simulator in the current state of this one,
+		whose rounds don't affect this one, e.g. to try out moves by step
+
+		The state is copied, the rest is shared: the parameters and the
+		player objects (so playing rounds which ask the players would
+		change their state; use step instead). The fork has no players'
+		hosts, visualization, recorder or profiler, and reports its events
+		to events (by default nowhere).
+		"""
+		sim = _copy(self)
+		sim.map = _copy(self.map)
+		sim.map._status = self.map._status.copy()
+		sim.map._objects = self.map._objects.copy()
+		sim._players = list(self._players)
+		sim._status = [ _copy(s) for s in self._status ]
+		sim._pubStat = [ _copy(pub) for pub in self._pubStat ]
+		sim._goldPots = dict(self._goldPots)
+		sim._mines = dict(self._mines)
+		sim._mineExpiry = { e: list(xys) for e, xys in self._mineExpiry.items() }
+		sim._freeCells = self._freeCells.copy()
+		sim._playerIndex = self._playerIndex.copy()
+		sim._observed = [ None for s in self._status ]
+		if hasattr(self, "_tasksThisRound"):
+			sim._tasksThisRound = list(self._tasksThisRound)
+		sim.rng = random.Random(0)
+		sim.rng.setstate(self.rng.getstate())
+
+		sim.events = NullSink() if events is None else events
+		sim.illustrator = _copy(self.illustrator)
+		sim.illustrator.active = False
+		sim.illustrator.vizfile = sim.illustrator.streamdir = None
+		sim.recorder = None
+		sim.profiler = None
+		sim._hosts = []
+		sim._loop = None
+		return sim
+
+	def step(self, moves, mines=None):
+		"""
+		Play the next round with the given actions instead of asking the
+		players
+
+		@param moves for every player, the list of its moves (Direction)
+		@param mines for every player, the list of the fields where it sets
+		mines; None for no mines at all
+		"""
+		if mines is None:
+			mines = [ [] for m in moves ]
+		assert len(moves) == len(mines) == len(self._players)
+		self._actions = { "round_begin": [ None for m in moves ], "set_mines": mines, "move": moves }
+		try:
+			self._play_round(self.round + 1)
+		finally:
+			self._actions = None
+
+	def _log(self, kind, level=INFO, **data):
+		"""
+		Report an event of the current round to self.events
+		"""
+		if self.events.enabled(level):
+			self.events.emit(Event(kind, level, self.round, **data))
+
 	# relocate gold pot(s)
 	def _empty_and_relocate_gold_pots(self):
 		for coord, amount in self._goldPots.items():
-			print("Gold pot at ({:>3}, {:>3}) with {} coints emtpied and relocated\n".
-					format(coord[0], coord[1], amount))
+			if self.printEvents:
+				self._log("pot_relocated", x=coord[0], y=coord[1], amount=amount)
 			self.map[coord].obj = None
+			self._freeCells.add(coord)
 
 		self._goldPots = {}
 		for i in range(self.params.maxNumGoldPots):
@@ -127,12 +318,14 @@ class Simulator(object):
 
 	def _begin_round(self, r):
 		# remove expired mines
-		for xy,expirydate in list(self._mines.items()):
-			if expirydate <= r:
+		for expirydate in sorted(e for e in self._mineExpiry if e <= r):
+			for xy in self._mineExpiry.pop(expirydate):
 				# remove the mine
 				del self._mines[xy]
-				self.map[xy] = Tile(TileStatus.Empty)
-				print("Remove expired mine at %s." % (str(xy)) )
+				self.map._status[xy[1], xy[0]] = TileStatus.Empty.value
+				self._freeCells.add(xy)
+				if self.printEvents:
+					self._log("mine_expired", x=xy[0], y=xy[1])
 
 		# relocate gold pots if timed out
 		self.goldPotRemainingRounds -=1
@@ -154,14 +347,88 @@ class Simulator(object):
 		# reset the task counter
 		self._tasksThisRound = [0 for pId in self._players]
 
-		if self.printRoundBegin:
-			# https://stackoverflow.com/questions/2084508/clear-terminal-in-python
-			#print(chr(27) + "[2J")
-			print("=" * 80)
-			print("Round %d:" % r)
-			print(self)
-		for p in self._players:
-			p.round_begin(r)
+		if self.printRoundBegin and self.events.enabled(INFO):
+			self._log("board", title="Round %d:" % r, separator="=" * 80 + "\n", board=str(self))
+		answers = self._ask_players("round_begin", lambda pId: (r,),
+			getattr(self.params, "roundBeginTimeout", None))
+		for pId, (answer, seconds) in enumerate(answers):
+			if isinstance(answer, Exception):
+				self._check_answer(pId, answer)
+
+	def _event_loop(self):
+		if self._loop is None:
+			self._loop = asyncio.new_event_loop()
+			# players hosted in-process run in threads, all at once (in
+			# arenas with many players, up to maxThreads at once)
+			self._loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+				max_workers=max(1, min(len(self._players), self.maxThreads))))
+		return self._loop
+
+	def _close_loop(self):
+		if self._loop is not None:
+			self._loop.run_until_complete(self._loop.shutdown_default_executor())
+			self._loop.close()
+			self._loop = None
+
+	def _ask_players(self, method, argsFor, timeout):
+		"""
+		Call a method of all players concurrently, each against the deadline
+		timeout (enforced for players in worker processes), so a round takes
+		as long as the slowest player instead of all players together
+
+		@param argsFor function from the player id to the arguments
+		@returns for every player the pair of the answer (or the exception
+		raised by the call) and the seconds it took
+		"""
+		if self._actions is not None:
+			# given to step
+			return [ (list(answer) if answer is not None else None, 0.0) for answer in self._actions[method] ]
+
+		async def ask(pId):
+			startTime = time.perf_counter()
+			try:
+				answer = await self._hosts[pId].call_async(method, *argsFor(pId),
+					status=self._pubStat[pId], timeout=timeout)
+			except Exception as e:
+				answer = e
+			seconds = time.perf_counter() - startTime
+			if self.profiler is not None:
+				self.profiler.record_call(pId, method, seconds)
+			return answer, seconds
+
+		async def askAll():
+			return await asyncio.gather(*[ ask(pId) for pId in range(len(self._players)) ])
+
+		return self._event_loop().run_until_complete(askAll())
+
+	def _check_answer(self, pId, answer):
+		"""
+		Report an exception of a player; answers which are no exceptions
+		pass unchanged
+
+		@returns the answer, None for exceptions
+		"""
+		if isinstance(answer, PlayerDisabled):
+			# reported once, when it happens
+			if answer.first:
+				self._log("player_disabled", ERROR, player=pId, message=str(answer))
+		elif isinstance(answer, TimeoutError):
+			self._log("player_timeout", WARNING, player=pId)
+		elif isinstance(answer, NotImplementedError):
+			# if not implemented, simply pass w/o making some fuss about it
+			pass
+		elif isinstance(answer, Exception):
+			self._report_exception(pId, answer)
+		else:
+			return answer
+		return None
+
+	def _report_exception(self, pId, e):
+		if isinstance(e, PlayerError):
+			tb = e.remote_traceback
+		else:
+			tb = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+		self._log("player_error", ERROR, player=pId, message=str(e), traceback=tb)
 
 	def _increase_health(self, pId, amount):
 		self._status[pId].health = min(self.params.maxHealth, 
@@ -185,304 +452,133 @@ class Simulator(object):
 				self._goldPots[pos] += 1
 		return True
 
+	def _pay_for_tasks(self, pId, n):
+		"""
+		Pay for up to n tasks at once, like n calls of _pay_for_task
+
+		@returns the number of tasks which could be payed for
+		"""
+		s = self._status[pId]
+		t = self._tasksThisRound[pId]
+		# the i-th next task costs t + i, so k tasks cost k*t + k*(k+1)/2;
+		# solve for the largest k which is affordable
+		b = 2*t + 1
+		k = (math.isqrt(b*b + 8*s.gold) - b) // 2 if s.gold > 0 else 0
+		k = max(0, min(k, n))
+		if k == 0:
+			return 0
+		s.gold -= k*t + k*(k + 1)//2
+		self._tasksThisRound[pId] += k
+		change = -k if self.params.goldDecrease and self.goldPotRemainingRounds <= self.params.goldDecreaseTime else k
+		for pos in self._goldPots:
+			self._goldPots[pos] += change
+		return k
+
 	def _handle_shooting(self, r):
 		# TODO
 		pass
 
 	def _handle_setting_mines(self, r):
-		# just go through players and set their mines - rules are
+		# first, ask all players whether and where to set mines
+		answers = self._ask_players("set_mines", lambda pId: (self._pubStat[pId],),
+			getattr(self.params, "setMinesTimeout", None))
+
+		# then go through players and set their mines - rules are
 		# sufficiently simple, to handle player one-by-one
 		for pId in range(len(self._players)):
-			player = self._players[pId]
-			pstatus = player.status
+			pstatus = self._status[pId]
 			player_coords = (pstatus.x, pstatus.y)
 
-			# first, ask the player whether and where to set mines
+			mines = answers[pId][0]
 			try:
-				mines = list(self._players[pId].set_mines(self._pubStat[pId]))
-
-				# check that the answer is in correct
-				# format
-				for (x,y) in mines:
-					if not (isinstance(x,int) and
-						isinstance(y,int)):
-						raise TypeError("Player's set mines must return list of coordinates")
-					# catch out of bounds -- errors invalidate the entire action
-					if x<0 or x>=self.map.width or y<0 or y>=self.map.height:
-						raise ValueError("Mine coordinates not on the map")
-
-			except NotImplementedError as e:
-				# if not implemented, simply pass w/o
-				# making some fuzz about it
-				mines = []
-				pass
+				if isinstance(mines, Exception):
+					raise mines
+				coords = self._check_mines(mines)
 			except Exception as e:
-				print("ERROR: player %d raised an exception: %s" % (pId, str(e)))
-				traceback.print_exc(file=sys.stdout)
+				self._check_answer(pId, e)
 				mines = []
 
-			# place mines and charge the player
-			for xy in mines:
-				paid=True
-				d = self._distance(player_coords, xy)
-				for i in range(d):
-					paid = self._pay_for_task(pId)
-					if not paid: break
-				if paid:
-					# set the mine
-					# if it is legal to place it (otherwise ignore, but still charge!)
-					if not self.map[xy].is_blocked() and self.map[xy].obj is None:
-						self._mines[xy] = r + self.params.mineExpiryTime
-						self.map[xy] = Tile(TileStatus.Mine)
-						print("Player %s sets mine at %s (distance %d; expires in round %d)."
-							% (str(pId), str(xy), d, self._mines[xy]) )
-				else:
-					break # don't even try to set more mines
-
-	def _askPlayerForMoves(self,pId):
-		try:
-			q = multiprocessing.Queue()
-
-			def ask():
-				q.put( list(self._players[pId].move(self._pubStat[pId])) )
-
-			p = multiprocessing.Process(target=ask())
-			p.start()
-			moves = q.get(timeout = self.params.moveTimeout)
-
-			# check that the answer is in correct
-			# format
-			for m in moves:
-				if not isinstance(m, Direction):
-					raise TypeError("Players must return moves as list of directions")
-		except queue.Empty as e:
-			print("ERROR: player %d didn't answer in time." % (pId))
-			moves = []
-		except Exception as e:
-			print("ERROR: player %d raised an exception: %s" % (pId, str(e)))
-			traceback.print_exc(file=sys.stdout)
-			moves = []
-
-		if p.is_alive():
-			p.terminate()
-		p.join()
-		return moves
+			if self.recorder is not None:
+				self.recorder.record_mines(pId, mines)
+
+			if len(mines) > 0:
+				self._set_mines(pId, player_coords, coords, r)
+
+	def _check_mines(self, mines):
+		"""
+		Check that the answer of set_mines is in correct format
+
+		@returns the coordinates as int array of shape (number of mines, 2)
+		"""
+		mines = [ (x, y) for (x, y) in mines ]
+		if not all(isinstance(x, int) and isinstance(y, int) for x, y in mines):
+			raise TypeError("Player's set mines must return list of coordinates")
+		coords = np.array(mines, dtype=np.int64).reshape(-1, 2)
+		# catch out of bounds -- errors invalidate the entire action
+		if np.any((coords < 0) | (coords >= (self.map.width, self.map.height))):
+			raise ValueError("Mine coordinates not on the map")
+		return coords
+
+	def _set_mines(self, pId, player_coords, coords, r):
+		"""
+		Charge the player for all mines at once and set them
+
+		Every mine costs as many tasks as it is away from the player. The
+		mines are paid in order, until the gold runs out; a mine which can't
+		be paid completely and all after it are not set (but the tasks paid
+		for it are charged). A paid mine is set if it is legal to place it,
+		otherwise it is ignored, but still charged!
+		"""
+		d = np.abs(coords - player_coords).max(axis=1)
+		paid = self._pay_for_tasks(pId, int(d.sum()))
+		n = int(np.searchsorted(np.cumsum(d), paid, side="right"))
+
+		xs, ys = coords[:n, 0], coords[:n, 1]
+		# legal: free tiles, and only the first of several mines at a tile
+		legal = self._freeCells.contains(xs, ys)
+		first = np.zeros(n, dtype=bool)
+		first[np.unique(ys*self.map.width + xs, return_index=True)[1]] = True
+		legal &= first
+
+		expires = r + self.params.mineExpiryTime
+		placed = self._mineExpiry.setdefault(expires, [])
+		for i in np.flatnonzero(legal):
+			xy = (int(xs[i]), int(ys[i]))
+			self._mines[xy] = expires
+			placed.append(xy)
+			self.map._status[xy[1], xy[0]] = TileStatus.Mine.value
+			self._freeCells.discard(xy)
+			if self.printEvents:
+				self._log("mine_set", player=pId, x=xy[0], y=xy[1], distance=int(d[i]),
+					expires=expires)
+		if not placed:
+			del self._mineExpiry[expires]
 
 	# @param r round index
 	def _handle_moving(self, r):
-		numPlayers = len(self._players)
-		movesPerPlayer = []  # from the user
-		moveStatusPerPlayer = []  # should be given to the user
-
-		#movesPerPlayer = [ self._askPlayerForMoves(pId) for pId in range(numPlayers) ]
-
-		print("Ask players for moves...")
-		q = queue.Queue()
-		def askPlayer(pId,startTime):
-			moves = self._askPlayerForMoves(pId)
-			q.put( (pId, moves) )
-			print("Player {} returns moves after {:3.1f}s: {}"
-					.format( pId, time.time()-startTime, list(map(str,moves)) ))
-
-		threads = [ threading.Thread( target=askPlayer, args=(pId,time.time()) ) 
-					for pId in range(numPlayers) ]
-		for t in threads: t.start()
-		for t in threads: t.join()
-
-		movesPerPlayer = [None] * len(self._players)
-		while not q.empty():
-			(pId, moves) = q.get()
-			movesPerPlayer[pId] = moves
-
-		for moves in movesPerPlayer:
-			mStatus = [MoveStatus.Pending for m in moves]
-			moveStatusPerPlayer.append(mStatus)
-			if self._debugMoves:
-				print("Debug: %s; [%s]" % (nameFromPlayerId(pId), ", ".join(str(m) for m in moves)))
-
-		def cancelRest(pId, mId):
-			for i in range(mId + 1, len(movesPerPlayer[pId])):
-				moveStatusPerPlayer[pId][i] = MoveStatus.Cancelled
-
-		# do a move for each player in lock-step
-		maxNumMoves = max(len(ms) for ms in movesPerPlayer)
-		for mId in range(maxNumMoves):
-			# collect all pairs of positions,
-			# and evaluate if the player is actually allowed to move
-			moves = [None for p in self._players]
-			for pId in range(len(self._players)):
-				now = self._status[pId].x, self._status[pId].y
-				then = now
-				moves[pId] = (now, then)
-				# first, this player may actually have no more moves
-				if mId >= len(movesPerPlayer[pId]):
-					continue
-				# a player must _always_ pay for a move, even though it is not carried out
-				paid = self._pay_for_task(pId)
-				# a previous move in this round could have cancelled this move
-				if moveStatusPerPlayer[pId][mId] == MoveStatus.Cancelled:
-					continue
-				assert moveStatusPerPlayer[pId][mId] == MoveStatus.Pending
-
-				# if we can't pay, don't move, and cancel everything afterwards
-				if not paid:
-					moveStatusPerPlayer[pId][mId] = MoveStatus.OutOfGold
-					cancelRest(pId, mId)
-					continue
-
-				# if we are too weak then we can't move either
-				if self._status[pId].health < self.params.minMoveHealth:
-					moveStatusPerPlayer[pId][mId] = MoveStatus.OutOfHealth
-					print("Player",pId,"is too weak to move")
-					continue
-
-				# otherwise, actually try to move
-				moveStatusPerPlayer[pId][mId] = MoveStatus.Done
-				diff = movesPerPlayer[pId][mId].as_xy()
-				then = now[0] + diff[0], now[1] + diff[1]
-				moves[pId] = (now, then)
-			# check collisions
-			# - with walls or the boundary
-			for pId in range(len(moves)):
-				if mId >= len(movesPerPlayer[pId]):
-					continue
-				ms = moveStatusPerPlayer[pId][mId]
-				if ms != MoveStatus.Done:
-					continue
-				dest = moves[pId][1]
-				if (
-					dest[0] < 0 or dest[0] >= self.map.width
-					or dest[1] < 0 or dest[1] >= self.map.height
-					or self.map[dest].status != TileStatus.Empty
-					):
-					moveStatusPerPlayer[pId][mId] = MoveStatus.CrashWall
-					cancelRest(pId, mId)
-					moves[pId] = moves[pId][0], moves[pId][0]
-
-			# identify crashs
-			#   - 1) two or more players move to the same position;
-			#	 this includes that one of the players does not move
-			#   - 2) two players swap positions (crossing paths)
-			#   crashs change the moving behavior -> we need to calculate a fix point
-
-			while True:
-				# check crash of type (1)
-				targets=dict()
-				for pId,p in enumerate(self._players):
-					dest = moves[pId][1]
-					if dest not in targets:
-						targets[dest] = list()
-					targets[dest].append(pId)
-
-				crashed=set()
-				for t in targets:
-					if len(targets[t])>1:
-						#print("Crash of robots", targets[t],"at",t)
-						for pId in targets[t]:
-							crashed.add(pId)
-
-				# check crash of type (2)
-				for pId1,p1 in enumerate(self._players):
-					for pId2,p2 in enumerate(self._players):
-						if pId1==pId2: continue
-						if moves[pId1] == moves[pId2][::-1]:
-							#print("Crossing paths of robots",
-							#      pId1,"and",pId2,"at",moves[pId1])
-							crashed.add(pId1)
-							crashed.add(pId2)
-
-				for pId in crashed:
-					moves[pId] = moves[pId][0],moves[pId][0]
-					if mId < len(movesPerPlayer[pId]):
-						moveStatusPerPlayer[pId][mId] = MoveStatus.CrashPlayer
-						cancelRest(pId, mId)
-
-				if len(crashed)>0: continue
-				else: break
-
-			# update health after crashes
-			for pId in range(len(moves)):
-				if mId >= len(movesPerPlayer[pId]):
-					continue
-				ms = moveStatusPerPlayer[pId][mId]
-				if ms == MoveStatus.CrashWall:
-					self._decrease_health(pId, self.params.healthPerWallCrash)
-				elif ms == MoveStatus.CrashPlayer:
-					self._decrease_health(pId,
-						self.params.healthPerPlayerCrash
-						+ random.randint(0,self.params.healthPerPlayerCrashRandom))
-
-			# print unsuccessful moves
-			if self._debugMoves:
-				print("Debug: move round %d" % mId)
-				for pId in range(len(self._players)):
-					print("Debug: move status %s; [%s]" % (nameFromPlayerId(pId),
-						", ".join(str(m) for m in moveStatusPerPlayer[pId])))
-			if self.printEvents:
-				for pId in range(len(moves)):
-					if mId >= len(movesPerPlayer[pId]):
-						continue
-					ms = moveStatusPerPlayer[pId][mId]
-					assert ms != MoveStatus.Pending
-					if ms == MoveStatus.Done:
-						continue
-					mStr = str(movesPerPlayer[pId][mId])
-					pStr = nameFromPlayerId(pId)
-					if ms == MoveStatus.CrashWall:
-						print("Event: %s crashed into a wall while trying to move %s." % 
-							(pStr, mStr))
-					elif ms == MoveStatus.CrashPlayer:
-						print("Event: %s crashed into another player while trying to move %s." % 
-							(pStr, mStr))
-					elif ms == MoveStatus.OutOfGold:
-						print("Event: %s could not move %s. No enough gold." % (pStr, mStr))
-					elif ms == MoveStatus.OutOfHealth:
-						print("Event: %s could not move %s. No health." % (pStr, mStr))
-					elif ms == MoveStatus.Cancelled:
-						print("Event: %s could not move %s due to a previous event this round." % 
-							(pStr, mStr))
-					else:
-						print("Bug: %s could not move due to some strange reason (debug: ms == %s)." % 
-							(pStr, str(ms)))
-
-			# update positions
-			# - first remove them
-			toUpdate = []
-			for pId in range(len(moves)):
-				if mId >= len(movesPerPlayer[pId]):
-					continue
-				ms = moveStatusPerPlayer[pId][mId]
-				if ms != MoveStatus.Done:
-					continue
-				if self.printMoves:
-					print("Event:", nameFromPlayerId(pId), "moved", movesPerPlayer[pId][mId])
-				toUpdate.append(pId)
-				assert self.map[moves[pId][0]].obj is not None
-				assert self.map[moves[pId][0]].obj.is_player(pId)
-				self.map[moves[pId][0]].obj = None
-			# - then add them again at new positions
-			#   ... while taking gold
-			numGoldPotsTaken = 0
-			for pId in toUpdate:
-				destObj = self.map[moves[pId][1]].obj
-				if destObj is not None:
-					assert destObj.is_gold()
-					amount = self._goldPots[moves[pId][1]]
-					if self.printEvents:
-						print("Event:", nameFromPlayerId(pId), "took a pot of %d gold." % amount)
-					self._status[pId].gold += amount
-					del self._goldPots[moves[pId][1]]
-					numGoldPotsTaken += 1
-				self.map[moves[pId][1]].obj = TileObject.makePlayer(pId)
-				self._status[pId].x, self._status[pId].y = moves[pId][1]
-			#relocate other gold pots(starts new timer)
-			if numGoldPotsTaken>0:
-				if (self.params.maxNumGoldPots-numGoldPotsTaken)>0:
-					self._empty_and_relocate_gold_pots()
-				else:
-					self.goldPotRemainingRounds = self.params.goldPotTimeOut
-			for i in range(numGoldPotsTaken):
-				self._add_gold_pot()
+		self._log("ask_moves")
+		answers = self._ask_players("move", lambda pId: (self._pubStat[pId],), self.params.moveTimeout)
+
+		movesPerPlayer = []
+		for pId, (moves, seconds) in enumerate(answers):
+			try:
+				if isinstance(moves, Exception):
+					raise moves
+				# check that the answer is in correct
+				# format
+				for m in moves:
+					if not isinstance(m, Direction):
+						raise TypeError("Players must return moves as list of directions")
+			except Exception as e:
+				self._check_answer(pId, e)
+				moves = []
+			self._log("player_moves", player=pId, seconds=seconds, moves=list(map(str,moves)))
+			movesPerPlayer.append(moves)
+
+		if self.recorder is not None:
+			self.recorder.record_moves(movesPerPlayer)
+
+		MoveEngine(self).run(movesPerPlayer)
 
 	def _handle_healing(self, r):
 		# TODO
@@ -491,51 +587,74 @@ class Simulator(object):
 	def _copy_to_public(self, pri, pub):
 		assert pri.player == pub.player
 		pub.x, pub.y, pub.health, pub.gold = pri.x, pri.y, pri.health, pri.gold
-		pub.map = Map(width=self.map.width, height=self.map.height)
-		# copy the part that is visible
+		# the visible part of the map (and the gold pots)
 		xl = max(pri.x - self.params.visibility, 0)
 		yl = max(pri.y - self.params.visibility, 0)
 		xu = min(pri.x + self.params.visibility, self.map.width - 1)
 		yu = min(pri.y + self.params.visibility, self.map.height - 1)
-		for x in range(xl, xu + 1):
-			for y in range(yl, yu + 1):
-				pub.map[x, y] = copy.deepcopy(self.map[x, y])
-		pub.goldPots = copy.deepcopy(self._goldPots)
-		for x, y in self._goldPots:
-			pub.map[x, y] = copy.deepcopy(self.map[x, y])
+		pub.map = MapWindow(self.map, xl, yl, xu, yu, extra=self._goldPots)
+		pub.goldPots = dict(self._goldPots)
+		if self.deltaObservations:
+			pub.delta = self._observation_delta(pub.player, pub.map)
 
 		pub.goldPotRemainingRounds = self.goldPotRemainingRounds
 
 		# make information about other visible players available
-		pub.others = list()
-		for status in self._status:
-			pubStatus = None
-			if (status.player != pub.player
-				and xl <= status.x and status.x <= xu
-				and yl <= status.y and status.y <= yu):
-				pubStatus = copy.deepcopy(status)
-			pub.others.append(pubStatus)
+		pub.others = [ None ] * len(self._status)
+		for pId in self._playerIndex.within(xl, yl, xu, yu):
+			if pId != pub.player:
+				status = self._status[pId]
+				pub.others[pId] = OtherPlayer(status.player, status.x, status.y, status.health, status.gold)
+
+	def _observation_delta(self, pId, window):
+		"""
+		The tiles of the window which the player didn't see in its previous
+		observation or which changed since then, and the visible tiles
+		outside the window (the gold pots)
+
+		A player restarted by its host lost its map, so it gets all tiles.
+		"""
+		restarts = getattr(self._hosts[pId], "restarts", 0) if pId < len(self._hosts) else 0
+		previous = self._observed[pId]
+		self._observed[pId] = (window, restarts)
+
+		xl, yl, xu, yu = window.window
+		tiles = window._winStatus
+		changed = np.ones(tiles.shape, dtype=bool)
+		if previous is not None and previous[1] == restarts:
+			old = previous[0]
+			pxl, pyl, pxu, pyu = old.window
+			# compare where the windows overlap
+			oxl, oyl, oxu, oyu = max(xl, pxl), max(yl, pyl), min(xu, pxu), min(yu, pyu)
+			if oxl <= oxu and oyl <= oyu:
+				changed[oyl - yl:oyu - yl + 1, oxl - xl:oxu - xl + 1] = (
+					tiles[oyl - yl:oyu - yl + 1, oxl - xl:oxu - xl + 1]
+					!= old._winStatus[oyl - pyl:oyu - pyl + 1, oxl - pxl:oxu - pxl + 1])
+		ys, xs = np.nonzero(changed)
+		status = tiles[ys, xs]
+		if window._extra:
+			extra = list(window._extra.items())
+			xs = np.concatenate([ xs + xl, [ x for (x, y), so in extra ] ])
+			ys = np.concatenate([ ys + yl, [ y for (x, y), so in extra ] ])
+			status = np.concatenate([ status, [ so[0] for xy, so in extra ] ]).astype(tiles.dtype)
+		else:
+			xs, ys = xs + xl, ys + yl
+		return MapDelta(xs, ys, status)
 
 	@staticmethod
 	def _distance(xy,xy1):
 		return max(abs(xy1[0]-xy[0]),abs(xy1[1]-xy[1]))
 
-	def _min_dist_to_player(self,xy):
-		"""
-		Return the minimum distance of xy to any of the players
-		"""
-		return min( self._distance(xy, (self._status[pId].x,self._status[pId].y))
-			for pId in range(len(self._players)) )
-
 	def _add_gold_pot(self):
 		# find a spot nicely remote from the robots
-		if len(self._players)>0:
+		if len(self._playerIndex)>0:
 			(x,y) = max( [ self._random_empty_spot() for i in range(7) ],
-						key=lambda xy: self._min_dist_to_player(xy) )
+						key=self._playerIndex.nearestDistance )
 		else:
 			(x,y) = self._random_empty_spot()
 
 		self.map[x, y].obj = TileObject.makeGold()
+		self._freeCells.discard((x,y))
 		self._goldPots[x, y] = self.params.initialGoldPotAmount
 
 	def __str__(self):
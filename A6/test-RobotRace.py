@@ -103,10 +103,14 @@ class MyNonRandomPlayer(Player):
 		ourMap = self.ourMap
 		# print("Our Map, before")
 		# print(ourMap)
-		for x in range(ourMap.width):
-			for y in range(ourMap.height):
-				if status.map[x, y].status != TileStatus.Unknown:
-					ourMap[x, y].status = status.map[x, y].status
+		if status.delta is not None:
+			# only the tiles which changed since the last round
+			ourMap.applyDelta(status.delta)
+		else:
+			for x in range(ourMap.width):
+				for y in range(ourMap.height):
+					if status.map[x, y].status != TileStatus.Unknown:
+						ourMap[x, y].status = status.map[x, y].status
 		# print("Our Map, after")
 		# print(ourMap)
 
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# Checks of move_engine against the move resolution it replaced (the
+# fix-point loop formerly in Simulator._handle_moving), on random boards
+# and on hand-written cases of every kind of move status.
+# Run with ./test_move_engine.py (or pytest test_move_engine.py).
+import random
+
+import numpy as np
+
+from game_utils import Direction as D, Map, MoveStatus as MS, TileObject, TileStatus
+from player_base import Player
+from simulator import Simulator
+from move_engine import MoveEngine, find_crashes
+from events import NullSink
+
+
+def reference_crashes(moves):
+	"""
+	The former crash check: find all crashes again, until no new one arises
+
+	@param moves list of (from, to) positions per player
+	@returns set of the ids of the crashed players, and the moves where
+	crashed players stay
+	"""
+	moves = list(moves)
+	allCrashed = set()
+	while True:
+		# check crash of type (1)
+		targets = {}
+		for pId, (now, then) in enumerate(moves):
+			targets.setdefault(then, []).append(pId)
+		crashed = set()
+		for group in targets.values():
+			if len(group) > 1:
+				crashed.update(group)
+
+		# check crash of type (2)
+		for pId1 in range(len(moves)):
+			for pId2 in range(len(moves)):
+				if pId1 != pId2 and moves[pId1] == moves[pId2][::-1]:
+					crashed.add(pId1)
+					crashed.add(pId2)
+
+		for pId in crashed:
+			moves[pId] = moves[pId][0], moves[pId][0]
+		allCrashed.update(crashed)
+		if not crashed:
+			return allCrashed, moves
+
+
+def reference_run(sim, movesPerPlayer):
+	"""
+	The former lock-step move loop, on the bookkeeping of the current
+	simulator (free tiles, player index, rng)
+
+	@returns list of the MoveStatus of every move of each player
+	"""
+	moveStatusPerPlayer = [ [MS.Pending for m in moves] for moves in movesPerPlayer ]
+
+	def cancelRest(pId, mId):
+		for i in range(mId + 1, len(movesPerPlayer[pId])):
+			moveStatusPerPlayer[pId][i] = MS.Cancelled
+
+	maxNumMoves = max((len(ms) for ms in movesPerPlayer), default=0)
+	for mId in range(maxNumMoves):
+		moves = [None for p in movesPerPlayer]
+		for pId in range(len(movesPerPlayer)):
+			now = sim._status[pId].x, sim._status[pId].y
+			moves[pId] = (now, now)
+			if mId >= len(movesPerPlayer[pId]):
+				continue
+			paid = sim._pay_for_task(pId)
+			if moveStatusPerPlayer[pId][mId] == MS.Cancelled:
+				continue
+			if not paid:
+				moveStatusPerPlayer[pId][mId] = MS.OutOfGold
+				cancelRest(pId, mId)
+				continue
+			if sim._status[pId].health < sim.params.minMoveHealth:
+				moveStatusPerPlayer[pId][mId] = MS.OutOfHealth
+				continue
+			moveStatusPerPlayer[pId][mId] = MS.Done
+			diff = movesPerPlayer[pId][mId].as_xy()
+			moves[pId] = (now, (now[0] + diff[0], now[1] + diff[1]))
+
+		for pId in range(len(moves)):
+			if mId >= len(movesPerPlayer[pId]) or moveStatusPerPlayer[pId][mId] != MS.Done:
+				continue
+			dest = moves[pId][1]
+			if (
+				dest[0] < 0 or dest[0] >= sim.map.width
+				or dest[1] < 0 or dest[1] >= sim.map.height
+				or sim.map[dest].status != TileStatus.Empty
+				):
+				moveStatusPerPlayer[pId][mId] = MS.CrashWall
+				cancelRest(pId, mId)
+				moves[pId] = moves[pId][0], moves[pId][0]
+
+		crashed, moves = reference_crashes(moves)
+		for pId in crashed:
+			if mId < len(movesPerPlayer[pId]):
+				moveStatusPerPlayer[pId][mId] = MS.CrashPlayer
+				cancelRest(pId, mId)
+
+		for pId in range(len(moves)):
+			if mId >= len(movesPerPlayer[pId]):
+				continue
+			ms = moveStatusPerPlayer[pId][mId]
+			if ms == MS.CrashWall:
+				sim._decrease_health(pId, sim.params.healthPerWallCrash)
+			elif ms == MS.CrashPlayer:
+				sim._decrease_health(pId,
+					sim.params.healthPerPlayerCrash
+					+ sim.rng.randint(0, sim.params.healthPerPlayerCrashRandom))
+
+		toUpdate = []
+		for pId in range(len(moves)):
+			if mId >= len(movesPerPlayer[pId]) or moveStatusPerPlayer[pId][mId] != MS.Done:
+				continue
+			toUpdate.append(pId)
+			sim.map[moves[pId][0]].obj = None
+			sim._freeCells.add(moves[pId][0])
+		numGoldPotsTaken = 0
+		for pId in toUpdate:
+			dest = moves[pId][1]
+			if sim.map[dest].obj is not None:
+				sim._status[pId].gold += sim._goldPots.pop(dest)
+				numGoldPotsTaken += 1
+			sim.map[dest].obj = TileObject.makePlayer(pId)
+			sim._freeCells.discard(dest)
+			sim._status[pId].x, sim._status[pId].y = dest
+			sim._playerIndex.move(pId, dest)
+		if numGoldPotsTaken > 0:
+			if sim.params.maxNumGoldPots - numGoldPotsTaken > 0:
+				sim._empty_and_relocate_gold_pots()
+			else:
+				sim.goldPotRemainingRounds = sim.params.goldPotTimeOut
+		for i in range(numGoldPotsTaken):
+			sim._add_gold_pot()
+	return moveStatusPerPlayer
+
+
+def makeBoard(positions, walls=(), width=5, height=5, pot=None, gold=None, health=None):
+	"""
+	Simulator without output on an empty map with the given walls, the
+	players at the given positions and the gold pot at pot (default: the
+	upper right corner)
+	"""
+	m = Map.makeEmpty(width, height)
+	for x, y in walls:
+		m._status[y, x] = TileStatus.Wall.value
+	sim = Simulator(map=m, seed=0)
+	sim.events = NullSink()
+	for xy in positions:
+		sim.add_player(Player())
+	# take everything off the board, then put it where we want it
+	for xy in list(sim._goldPots):
+		sim.map[xy].obj = None
+		sim._freeCells.add(xy)
+	for s in sim._status:
+		sim.map[s.x, s.y].obj = None
+		sim._freeCells.add((s.x, s.y))
+	for pId, xy in enumerate(positions):
+		setPlayer(sim, pId, xy)
+		if gold is not None:
+			sim._status[pId].gold = gold
+		if health is not None:
+			sim._status[pId].health = health
+	pot = pot if pot is not None else (width - 1, height - 1)
+	sim.map[pot].obj = TileObject.makeGold()
+	sim._freeCells.discard(pot)
+	sim._goldPots = { pot: sim.params.initialGoldPotAmount }
+	sim._tasksThisRound = [0 for xy in positions]
+	return sim
+
+
+def setPlayer(sim, pId, xy):
+	sim.map[xy].obj = TileObject.makePlayer(pId)
+	sim._freeCells.discard(xy)
+	sim._playerIndex.move(pId, xy)
+	sim._status[pId].x, sim._status[pId].y = xy
+
+
+def runBoth(sim, movesPerPlayer):
+	"""
+	Run the moves by MoveEngine and by reference_run on forks of sim, check
+	that both agree on the statuses and the resulting state
+
+	@returns the statuses and the fork played by MoveEngine
+	"""
+	engine, reference = sim.fork(), sim.fork()
+	statuses = MoveEngine(engine).run([ list(ms) for ms in movesPerPlayer ])
+	expected = reference_run(reference, [ list(ms) for ms in movesPerPlayer ])
+	assert statuses == expected, (statuses, expected)
+	got, want = engine.snapshot(), reference.snapshot()
+	for key in want:
+		if isinstance(want[key], np.ndarray):
+			assert np.array_equal(got[key], want[key]), key
+		else:
+			assert got[key] == want[key], key
+	return statuses, engine
+
+
+def positions(sim):
+	return [ (s.x, s.y) for s in sim._status ]
+
+
+def test_find_crashes_random():
+	rng = random.Random(1)
+	for i in range(5000):
+		size = rng.randint(2, 6)
+		cells = [ (x, y) for x in range(size) for y in range(size) ]
+		starts = rng.sample(cells, rng.randint(1, min(len(cells), 12)))
+		moves = []
+		for now in starts:
+			if rng.random() < 0.3:
+				moves.append((now, now))
+			else:
+				dx, dy = rng.choice(list(D)).as_xy()
+				moves.append((now, (now[0] + dx, now[1] + dy)))
+		expected, expectedMoves = reference_crashes(moves)
+		crashed = find_crashes(moves)
+		assert crashed == expected, (moves, crashed, expected)
+		assert moves == expectedMoves
+
+
+def test_random_boards():
+	rng = random.Random(2)
+	for seed in range(150):
+		size = rng.randint(4, 12)
+		sim = Simulator(map=Map.makeRandom(size, size, 0.3, seed=seed), seed=seed)
+		sim.events = NullSink()
+		free = len(sim._freeCells)
+		for i in range(rng.randint(1, min(free - 1, 16))):
+			sim.add_player(Player())
+		for s in sim._status:
+			s.gold = rng.randint(0, 12)
+			s.health = rng.choice([10, 30, 60, 100])
+		# some mines, which block like walls
+		for i in range(rng.randint(0, 3)):
+			if len(sim._freeCells) > 1:
+				x, y = sim._random_empty_spot()
+				sim.map._status[y, x] = TileStatus.Mine.value
+				sim._freeCells.discard((x, y))
+		sim._tasksThisRound = [ rng.randint(0, 2) for s in sim._status ]
+		movesPerPlayer = [ [ rng.choice(list(D)) for m in range(rng.randint(0, 4)) ] for s in sim._status ]
+		runBoth(sim, movesPerPlayer)
+
+
+def test_crash_wall():
+	sim = makeBoard([(1, 2), (0, 0)], walls=[(2, 2)])
+	statuses, after = runBoth(sim, [[D.right, D.up], [D.left]])
+	assert statuses == [[MS.CrashWall, MS.Cancelled], [MS.CrashWall]]
+	assert positions(after) == [(1, 2), (0, 0)]
+	assert [ s.health for s in after._status ] == [75, 75]
+
+
+def test_crash_same_target():
+	sim = makeBoard([(0, 0), (2, 0)])
+	statuses, after = runBoth(sim, [[D.right, D.right], [D.left]])
+	assert statuses == [[MS.CrashPlayer, MS.Cancelled], [MS.CrashPlayer]]
+	assert positions(after) == [(0, 0), (2, 0)]
+	assert all(80 <= s.health <= 85 for s in after._status)
+
+
+def test_crash_swap():
+	sim = makeBoard([(0, 0), (1, 0)])
+	statuses, after = runBoth(sim, [[D.right], [D.left]])
+	assert statuses == [[MS.CrashPlayer], [MS.CrashPlayer]]
+	assert positions(after) == [(0, 0), (1, 0)]
+
+
+def test_crash_cascade():
+	# B and C crash at (2, 0), so B stays and A runs into it
+	sim = makeBoard([(0, 0), (1, 0), (3, 0)])
+	statuses, after = runBoth(sim, [[D.right], [D.right], [D.left]])
+	assert statuses == [[MS.CrashPlayer], [MS.CrashPlayer], [MS.CrashPlayer]]
+	assert positions(after) == [(0, 0), (1, 0), (3, 0)]
+
+
+def test_following_is_no_crash():
+	sim = makeBoard([(0, 0), (1, 0)])
+	statuses, after = runBoth(sim, [[D.right], [D.right]])
+	assert statuses == [[MS.Done], [MS.Done]]
+	assert positions(after) == [(1, 0), (2, 0)]
+
+
+def test_out_of_gold():
+	# the moves cost 1, 2, 3: the second can't be paid, the third is cancelled
+	sim = makeBoard([(0, 0)], gold=2)
+	statuses, after = runBoth(sim, [[D.up, D.up, D.up]])
+	assert statuses == [[MS.Done, MS.OutOfGold, MS.Cancelled]]
+	assert positions(after) == [(0, 1)]
+	assert after._status[0].gold == 1
+
+
+def test_out_of_health():
+	# too weak to move, but the moves are paid and not cancelled
+	sim = makeBoard([(0, 0)], health=20)
+	statuses, after = runBoth(sim, [[D.up, D.up]])
+	assert statuses == [[MS.OutOfHealth, MS.OutOfHealth]]
+	assert positions(after) == [(0, 0)]
+	assert after._status[0].gold == sim._status[0].gold - 3
+
+
+def test_cancelled_moves_are_paid():
+	sim = makeBoard([(0, 0), (3, 3)], walls=[(0, 1)])
+	statuses, after = runBoth(sim, [[D.up, D.right, D.right], [D.left, D.left, D.left]])
+	assert statuses == [[MS.CrashWall, MS.Cancelled, MS.Cancelled], [MS.Done, MS.Done, MS.Done]]
+	assert after._status[0].gold == sim._status[0].gold - 6
+	assert positions(after) == [(0, 0), (0, 3)]
+
+
+def test_take_gold_pot():
+	sim = makeBoard([(3, 4)], pot=(4, 4))
+	statuses, after = runBoth(sim, [[D.right]])
+	assert statuses == [[MS.Done]]
+	# the pot grew by one for the paid move
+	assert after._status[0].gold == sim._status[0].gold - 1 + sim.params.initialGoldPotAmount + 1
+	assert (4, 4) not in after._goldPots and len(after._goldPots) == 1
+
+
+if __name__ == "__main__":
+	tests = [ (name, f) for name, f in sorted(globals().items()) if name.startswith("test_") ]
+	for name, test in tests:
+		test()
+		print("%-32s ok" % name)
+	print("%d checks passed" % len(tests))